@@ -14,11 +14,23 @@ import argparse, json, pathlib, re
 from api.shopify_client import ShopifyClient
 from utils.state_gate import StateGate
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_loads = orjson.loads if orjson else json.loads
+
 def load_manifest(capsule: str):
     manifest_path = pathlib.Path(f"capsules/{capsule}/manifests/images_manifest.jsonl")
-    records = [json.loads(line) for line in manifest_path.read_text().splitlines() if line.strip()]
-    # This script's scope is only swatches and editorials (for look_image)
-    return [r for r in records if r["asset_type"] == "swatches"]
+    # This script's scope is only swatches and editorials (for look_image).
+    # Lines are streamed and only parsed when they can be a swatch record, so
+    # the full manifest is never held as a list of dicts.
+    with manifest_path.open("rb") as f:
+        return [
+            r for r in map(_loads, (line for line in f if b"swatches" in line))
+            if r["asset_type"] == "swatches"
+        ]
 
 def load_product_map(capsule: str):
     mapping_path = pathlib.Path(f"capsules/{capsule}/manifests/product_map.json")
@@ -26,15 +38,17 @@ def load_product_map(capsule: str):
         raise FileNotFoundError("product_map.json missing (CPI → Product GID mapping).")
     return json.load(open(mapping_path))
 
-def resolve_handle_from_state(gate: StateGate, cpi: str) -> str | None:
+def build_cpi_handle_index(gate: StateGate) -> dict:
     """
-    Resolve product handle from state using CPI.
-    Returns None if no matching product is found.
+    Map each CPI to its product handle in one pass over state, keeping the
+    first handle per CPI.
     """
+    index = {}
     for handle, record in gate.products.items():
-        if record.get("cpi") == cpi:
-            return handle
-    return None
+        cpi = record.get("cpi")
+        if cpi:
+            index.setdefault(cpi, handle)
+    return index
 
 def append_result(path: pathlib.Path, record: dict):
     with path.open("a", encoding="utf-8") as f:
@@ -67,6 +81,12 @@ def main(capsule: str, dry_run: bool = False, debug_cpi: str = None, cpis: list
     ]
 
     prod_map = load_product_map(capsule)
+    cpi_to_handle = build_cpi_handle_index(gate)
+
+    # CPIs with no product GID are resolved in one set difference up front
+    unmapped_cpis = target_cpis - prod_map.keys()
+    if unmapped_cpis:
+        print(f"  > Warning: {len(unmapped_cpis)} target CPI(s) have no product GID in product_map.json: {', '.join(sorted(unmapped_cpis))}")
 
     # Always fetch existing files to provide an accurate simulation.
     existing_files_map = client.get_staged_uploads_map()
@@ -97,7 +117,7 @@ def main(capsule: str, dry_run: bool = False, debug_cpi: str = None, cpis: list
     for cpi in sorted(target_cpis):
         rows = rows_by_cpi.get(cpi, [])
 
-        handle = resolve_handle_from_state(gate, cpi)
+        handle = cpi_to_handle.get(cpi)
         if not handle:
             raise RuntimeError(f"[STATE ERROR] No handle found in product_state for CPI {cpi}")
 
@@ -139,7 +159,7 @@ def main(capsule: str, dry_run: bool = False, debug_cpi: str = None, cpis: list
             print(f"[CPI SUMMARY] {cpi} | handle={handle} | gate=DENY | swatch={swatch_status} | look={look_status}")
             continue
 
-        if cpi not in prod_map:
+        if cpi in unmapped_cpis:
             # No product GID mapping found; treat as missing uploads
             swatch_status = "missing"
             look_status = "missing"
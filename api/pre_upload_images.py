@@ -256,10 +256,11 @@ def main(csv_path: str, base_dir: str, manifest_path: str, output_csv: str, port
     print(f"Mapping {len(url_map)} new URLs to CSV...")
     
     # Create a new 'Image Src' column based on the map
-    # This rebuilds the column from scratch
-    df['Image Src'] = df['Image Src'].apply(
-        lambda x: url_map.get(str(x).split('/')[-1], "") if pd.notna(x) else ""
-    )
+    # This rebuilds the column from scratch, as column ops: filename -> url,
+    # blank where the filename is unmapped or the source cell is empty
+    image_src = df['Image Src']
+    filenames = image_src.astype(str).str.rsplit('/', n=1).str[-1]
+    df['Image Src'] = filenames.map(url_map).fillna("").where(image_src.notna(), "")
     
     # Save the new CSV
     df.to_csv(output_csv, index=False, quoting=csv.QUOTE_ALL)
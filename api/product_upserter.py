@@ -156,7 +156,9 @@ def main():
     print(f"Fetching Shopify product data for capsule '{shop_capsule_tag}'...")
     
     try:
-        product_data_map = client.get_products_for_upsert(shop_capsule_tag, verbose=args.verbose)
+        product_data_map = client.get_products_for_upsert(
+            shop_capsule_tag, verbose=args.verbose, handles=handles_to_process
+        )
     except AttributeError as e:
         print(f"❌ Error: `ShopifyClient` is missing a required function: {e}", file=sys.stderr)
         return
@@ -222,15 +224,13 @@ def main():
                 
                 print(f"  > 🖼️  Will replace {len(existing_media_gids)} media items with {len(image_urls_to_create)} new images...")
 
-                # 1. Delete all old media
-                if existing_media_gids:
-                    client.delete_product_media(product_gid, existing_media_gids, args.dry_run, verbose=args.verbose)
-                
-                # 2. Create new media from the final Shopify URLs
-                if image_urls_to_create:
-                    # We can do this in one batch call, as the URLs are already on Shopify
-                    client.create_product_media(product_gid, image_urls_to_create, args.dry_run, verbose=args.verbose)
-                else:
+                # Delete all old media, then create new media from the final
+                # Shopify URLs (one batch call, as the URLs are already on Shopify)
+                client.replace_product_media(
+                    product_gid, existing_media_gids, image_urls_to_create,
+                    args.dry_run, verbose=args.verbose
+                )
+                if not image_urls_to_create:
                     print(f"  > ℹ️  No images listed in source CSV for this product.")
             
             if args.dry_run:
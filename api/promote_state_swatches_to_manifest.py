@@ -91,21 +91,22 @@ def main():
                 skipped += 1
                 continue
 
-            file_path = str(Path(file_path))
-            if not Path(file_path).exists():
-                print(f"[SKIP] {cpi} | swatch file missing on disk")
-                skipped += 1
-                continue
-
-            filename = Path(file_path).name
-            source_dir = str(Path(file_path).parent)
+            swatch_path = Path(file_path)
+            filename = swatch_path.name
+            source_dir = str(swatch_path.parent)
 
+            # Set membership first: swatches already in the manifest skip the disk check
             dedupe_key = (cpi, "swatches", filename)
             if dedupe_key in existing_rows:
                 print(f"[SKIP] {cpi} | swatch already in manifest")
                 skipped += 1
                 continue
 
+            if not swatch_path.exists():
+                print(f"[SKIP] {cpi} | swatch file missing on disk")
+                skipped += 1
+                continue
+
             row = {
                 "capsule": capsule,
                 "cpi": cpi,
@@ -125,7 +125,7 @@ def main():
         raise FileNotFoundError(f"Swatch directory not found: {swatch_dir} (expected default: capsules/{capsule}/assets/swatches)")
 
     products = state.get("products", {})
-    target_cpis = args.cpis or [p.get("cpi") for p in products.values() if p.get("cpi")]
+    target_cpis = set(args.cpis or (p.get("cpi") for p in products.values() if p.get("cpi")))
 
     swatch_queue_path = Path(
         f"capsules/{capsule}/outputs/actions_swatch_queue_{capsule}.jsonl"
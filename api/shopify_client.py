@@ -6,11 +6,479 @@ Reads SHOP_URL, SHOPIFY_ACCESS_TOKEN, API_VERSION from .env
 and exposes a `ShopifyClient` class.
 """
 
-import os, time, json, requests, re
+import os, time, json, requests, re, functools, threading
 from dotenv import load_dotenv
 
+try:
+    import orjson  # Faster decode of GraphQL responses in poll loops
+except ImportError:
+    orjson = None
+
+try:
+    import httpx  # Optional HTTP/2 transport for GraphQL
+except ImportError:
+    httpx = None
+
 load_dotenv()
 
+# Extracts the SignedHeaders list from a staged upload URL's query string.
+_SIGNED_HEADERS_RE = re.compile(r"[?&]X-Goog-SignedHeaders=([^&]+)")
+
+# TTL (seconds) for cached read-only list queries (pages, products by type).
+# Single metafield reads are cached for the life of the client instead.
+_LIST_CACHE_TTL = 60
+
+@functools.lru_cache(maxsize=256)
+def _guess_mime_type(ext: str) -> str:
+    """Maps a lowercased file extension (e.g. '.jpg') to its upload MIME type."""
+    if ext == ".png":
+        return "image/png"
+    if ext in (".jpg", ".jpeg"):
+        return "image/jpeg"
+    return "application/octet-stream"
+
+# ---------------------------------------------------------------------
+#  GraphQL documents
+# ---------------------------------------------------------------------
+
+_Q_PRODUCTS_BY_TAG = """
+query getProductsByTag($query: String!, $cursor: String) {
+  products(first: 250, after: $cursor, query: $query) {
+    edges {
+      cursor
+      node {
+        id
+        handle
+        tags
+      }
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+_Q_SMART_COLLECTION_TITLES = """
+query getSmartCollections($cursor: String) {
+  collections(first: 250, after: $cursor, query: "collection_type:smart") {
+    edges {
+      cursor
+      node {
+        title
+      }
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+_Q_SMART_COLLECTIONS = """
+query getSmartCollections($cursor: String) {
+  collections(first: 250, after: $cursor, query: "collection_type:smart") {
+    edges {
+      cursor
+      node {
+        id
+        title
+        handle
+      }
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+_M_COLLECTION_DELETE = """
+mutation collectionDelete($input: CollectionDeleteInput!) {
+  collectionDelete(input: $input) {
+    deletedCollectionId
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+# Parameterized with the publication IDs AND status:active
+_Q_SMART_COLLECTIONS_WITH_PUBLICATIONS = """
+query getSmartCollections($cursor: String, $storePubId: ID!, $posPubId: ID!) {
+  collections(first: 100, after: $cursor, query: "collection_type:smart AND status:active") {
+    edges {
+      cursor
+      node {
+        id
+        title
+        handle
+        isPublishedOnStore: publishedOnPublication(publicationId: $storePubId)
+        isPublishedOnPOS: publishedOnPublication(publicationId: $posPubId)
+      }
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+_Q_PUBLICATIONS = """
+query getPublications($cursor: String) {
+  publications(first: 25, after: $cursor) {
+    edges {
+      cursor
+      node {
+        id
+        name
+      }
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+_M_PUBLISHABLE_PUBLISH = """
+mutation publishablePublish($id: ID!, $input: [PublicationInput!]!, $storePubId: ID!, $posPubId: ID!) {
+  publishablePublish(id: $id, input: $input) {
+    publishable {
+      ... on Collection {
+        id
+        # Re-check the status *after* the mutation
+        isPublishedOnStore: publishedOnPublication(publicationId: $storePubId)
+        isPublishedOnPOS: publishedOnPublication(publicationId: $posPubId)
+      }
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+_Q_PRODUCTS_FOR_QA = """
+query getProductsForQA($query: String!, $cursor: String) {
+  products(first: 100, after: $cursor, query: $query) {
+    edges {
+      cursor
+      node {
+        id
+        handle
+        tags
+        bodyHtml
+        images(first: 1) {
+          edges { node { id } }
+        }
+        swatch_metafield: metafield(namespace: "altuzarra", key: "swatch_image") {
+          value
+        }
+        details_metafield: metafield(namespace: "altuzarra", key: "details") {
+          value
+        }
+        look_image_metafield: metafield(namespace: "altuzarra", key: "look_image") {
+          value
+        }
+      }
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+_Q_FILES = """
+query($cursor: String) {
+  files(first: 250, after: $cursor) {
+    edges {
+      cursor
+      node {
+        id
+        ... on GenericFile {
+          url
+        }
+        ... on MediaImage {
+          originalSource {
+            url
+          }
+        }
+      }
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+_Q_FILES_WITH_URLS = """
+query($cursor: String) {
+  files(first: 250, after: $cursor) {
+    edges {
+      cursor
+      node {
+        id
+        ... on GenericFile {
+          url
+        }
+        ... on MediaImage {
+          image {           # <-- ADD THIS BLOCK
+            url
+          }                 # <-- ADD THIS BLOCK
+          originalSource {
+            url
+          }
+        }
+      }
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+_Q_RESOLVE_MEDIA_IMAGE = """
+query resolveMediaImage($id: ID!) {
+  node(id: $id) {
+    ... on MediaImage {
+      file {
+        id
+      }
+    }
+  }
+}
+"""
+
+_M_STAGED_UPLOADS_CREATE = """
+mutation stagedUploadsCreate($input: [StagedUploadInput!]!) {
+  stagedUploadsCreate(input: $input) {
+    stagedTargets {
+      url
+      resourceUrl
+      parameters {
+        name
+        value
+      }
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+_M_FILE_CREATE = """
+mutation fileCreate($files: [FileCreateInput!]!) {
+  fileCreate(files: $files) {
+    files {
+      id
+      fileStatus
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+_Q_CHECK_FILES_STATUS = """
+query checkFilesStatus($ids: [ID!]!) {
+  nodes(ids: $ids) {
+    id
+    ... on File {
+      fileStatus
+      ... on MediaImage {
+        image {
+          url
+        }
+        originalSource { url }
+      }
+      ... on GenericFile {
+        url
+      }
+    }
+  }
+}
+"""
+
+_Q_PRODUCT_METAFIELD = """
+query getProductMetafield($id: ID!, $namespace: String!, $key: String!) {
+  node(id: $id) {
+    ... on Product {
+      metafield(namespace: $namespace, key: $key) {
+        value
+      }
+    }
+  }
+}
+"""
+
+_M_METAFIELDS_SET = """
+mutation metafieldsSet($metafields: [MetafieldsSetInput!]!) {
+  metafieldsSet(metafields: $metafields) {
+    metafields { key namespace type value }
+    userErrors { field message }
+  }
+}
+"""
+
+_M_COLLECTION_CREATE = """
+mutation collectionCreate($input: CollectionInput!) {
+  collectionCreate(input: $input) {
+    collection { id handle title }
+    userErrors { field message }
+  }
+}
+"""
+
+_Q_SIZE_GUIDE_PAGES = """
+query getPages($cursor: String, $query: String) {
+  pages(first: 250, after: $cursor, query: $query) {
+    edges {
+      node {
+        id
+        title
+      }
+    }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+"""
+
+_Q_PRODUCTS_WITH_TYPE = """
+query getProductsWithType($query: String!, $cursor: String) {
+  products(first: 250, after: $cursor, query: $query) {
+    edges {
+      node {
+        id
+        handle
+        productType
+      }
+    }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+"""
+
+_Q_PRODUCTS_FOR_UPSERT = """
+query getProductsForUpsert($query: String!, $cursor: String) {
+  products(first: 250, after: $cursor, query: $query) {
+    edges {
+      node {
+        id
+        handle
+        media(first: 50) {
+          edges {
+            node {
+              id
+            }
+          }
+        }
+      }
+    }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+"""
+
+_M_PRODUCT_DELETE_MEDIA = """
+mutation productDeleteMedia($productId: ID!, $mediaIds: [ID!]!) {
+  productDeleteMedia(productId: $productId, mediaIds: $mediaIds) {
+    deletedMediaIds
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+_M_PRODUCT_CREATE_MEDIA = """
+mutation productCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
+  productCreateMedia(productId: $productId, media: $media) {
+    media {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+_Q_CHECK_MEDIA_STATUS = """
+query checkMediaStatus($ids: [ID!]!) {
+    nodes(ids: $ids) {
+    ... on MediaImage {
+        id
+        status
+    }
+    }
+}
+"""
+
+_M_PRODUCT_UPDATE = """
+mutation productUpdate($input: ProductInput!) {
+  productUpdate(input: $input) {
+    product {
+      id
+      handle
+      tags
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+_M_METAFIELDS_SET_STRING = """
+mutation metafieldsSet($metafields: [MetafieldsSetInput!]!) {
+  metafieldsSet(metafields: $metafields) {
+    metafields {
+      id
+      key
+      namespace
+      value
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+
+class IncompleteFetchError(RuntimeError):
+    """A paginated read stopped on an error; `partial` holds what was fetched before it."""
+
+    def __init__(self, message: str, partial):
+        super().__init__(message)
+        self.partial = partial
+
+
 class ShopifyClient:
     def __init__(self, verbose: bool = False):
         self.verbose = verbose
@@ -21,50 +489,100 @@ class ShopifyClient:
             raise EnvironmentError("Missing SHOP_URL or SHOPIFY_ACCESS_TOKEN in .env")
 
         self.endpoint = f"{self.shop_url}/admin/api/{self.api_version}/graphql.json"
-        self.session = requests.Session()
-        self.session.headers.update({
+        gql_headers = {
             "Content-Type": "application/json",
             "X-Shopify-Access-Token": self.token,
-        })
+        }
+        self.session = requests.Session()
+        self.session.headers.update(gql_headers)
+        # GraphQL goes over one multiplexed HTTP/2 connection when httpx[http2]
+        # is installed; otherwise it shares the requests session.
+        self._gql = self._make_gql_transport(gql_headers)
+
+        # In-process cache for pure reads: {cache_key: (expires_at | None, value)}
+        self._read_cache = {}
+        self._cache_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    def _make_gql_transport(self, headers: dict):
+        if httpx is not None:
+            try:
+                return httpx.Client(http2=True, timeout=30, headers=headers)
+            except ImportError:
+                # http2=True needs the 'h2' package (httpx[http2])
+                pass
+        return self.session
+
+    # ------------------------------------------------------------------
+    def _cache_get(self, cache_key: tuple):
+        """Returns (hit, value) for a cached read, evicting it if expired."""
+        with self._cache_lock:
+            entry = self._read_cache.get(cache_key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at is not None and time.time() >= expires_at:
+                del self._read_cache[cache_key]
+                return False, None
+            return True, value
+
+    def _cache_put(self, cache_key: tuple, value, ttl: float | None = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._cache_lock:
+            self._read_cache[cache_key] = (expires_at, value)
+
+    def invalidate_cache(self, product_gid: str | None = None, key: str | None = None):
+        """
+        Drops cached reads. With no arguments, clears everything.
+        Otherwise drops cached metafield reads matching product_gid and/or key,
+        so writes stay read-after-write consistent.
+        """
+        with self._cache_lock:
+            if product_gid is None and key is None:
+                self._read_cache.clear()
+                return
+            for cache_key in list(self._read_cache):
+                if cache_key[0] != "metafield":
+                    continue
+                _, cached_gid, _, cached_key = cache_key
+                if product_gid is not None and cached_gid != product_gid:
+                    continue
+                if key is not None and cached_key != key:
+                    continue
+                del self._read_cache[cache_key]
 
     # ------------------------------------------------------------------
     def graphql(self, query: str, variables: dict | None = None):
         """Perform a GraphQL POST with simple retry + throttle awareness."""
         payload = {"query": query, "variables": variables or {}}
-        resp = self.session.post(self.endpoint, json=payload)
+        resp = self._gql.post(self.endpoint, json=payload)
+        # Back off on 429 (honouring Retry-After) before giving up
+        delay = 1.0
+        for _ in range(5):
+            if resp.status_code != 429:
+                break
+            time.sleep(float(resp.headers.get("Retry-After") or delay))
+            delay *= 2
+            resp = self._gql.post(self.endpoint, json=payload)
         if resp.status_code != 200:
             raise RuntimeError(f"GraphQL HTTP {resp.status_code}: {resp.text}")
         
-        data = resp.json()
+        data = self._decode(resp)
         if data.get('extensions', {}).get('cost', {}).get('throttleStatus', {}).get('currentlyAvailable', 0) < 1000:
             time.sleep(2)
         return data
 
-    # ... (get_products_by_tag, get_all_smart_collection_titles can remain as-is) ...
+    @staticmethod
+    def _decode(resp) -> dict:
+        # orjson parses the raw bytes directly, skipping the str decode step
+        if orjson is not None:
+            return orjson.loads(resp.content)
+        return resp.json()
 
-    def get_products_by_tag(self, tag: str) -> list:
+    def get_products_by_tag_iter(self, tag: str):
         """
-        Fetches all products tagged with 'tag' from Shopify.
-        This function is used by other scripts, so we keep its prints.
-        """
-        print(f"Fetching all products tagged with '{tag}' from Shopify...")
-        products = []
-        query = """
-        query getProductsByTag($query: String!, $cursor: String) {
-          products(first: 250, after: $cursor, query: $query) {
-            edges {
-              cursor
-              node {
-                id
-                handle
-                tags
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
+        Yields products tagged with 'tag' page by page, so callers can start
+        processing before the last page has been fetched.
         """
         hasNextPage = True
         cursor = None
@@ -72,12 +590,20 @@ class ShopifyClient:
         while hasNextPage:
             if cursor:
                 variables["cursor"] = cursor
-            response = self.graphql(query, variables)
+            response = self.graphql(_Q_PRODUCTS_BY_TAG, variables)
             data = response.get("data", {}).get("products", {})
             for edge in data.get("edges", []):
-                products.append(edge.get("node", {}))
                 cursor = edge.get("cursor")
+                yield edge.get("node", {})
             hasNextPage = data.get("pageInfo", {}).get("hasNextPage", False)
+
+    def get_products_by_tag(self, tag: str) -> list:
+        """
+        Fetches all products tagged with 'tag' from Shopify.
+        This function is used by other scripts, so we keep its prints.
+        """
+        print(f"Fetching all products tagged with '{tag}' from Shopify...")
+        products = list(self.get_products_by_tag_iter(tag))
         print(f"Found {len(products)} products with the tag.")
         return products
     
@@ -88,21 +614,6 @@ class ShopifyClient:
         """
         print("Fetching all existing smart collection titles...")
         titles = set()
-        query = """
-        query getSmartCollections($cursor: String) {
-          collections(first: 250, after: $cursor, query: "collection_type:smart") {
-            edges {
-              cursor
-              node {
-                title
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
         variables = {}
@@ -111,7 +622,7 @@ class ShopifyClient:
             if cursor:
                 variables["cursor"] = cursor
             
-            response = self.graphql(query, variables)
+            response = self.graphql(_Q_SMART_COLLECTION_TITLES, variables)
             
             if 'errors' in response:
                 print("❌ GraphQL API returned errors:")
@@ -142,23 +653,6 @@ class ShopifyClient:
         """
         print("Fetching all smart collection objects (ID, Title, Handle)...")
         collections = []
-        query = """
-        query getSmartCollections($cursor: String) {
-          collections(first: 250, after: $cursor, query: "collection_type:smart") {
-            edges {
-              cursor
-              node {
-                id
-                title
-                handle
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
         variables = {}
@@ -167,7 +661,7 @@ class ShopifyClient:
             if cursor:
                 variables["cursor"] = cursor
             
-            response = self.graphql(query, variables)
+            response = self.graphql(_Q_SMART_COLLECTIONS, variables)
             
             if 'errors' in response:
                 print("❌ GraphQL API returned errors:")
@@ -195,19 +689,8 @@ class ShopifyClient:
         """
         Deletes a collection given its GID.
         """
-        mutation = """
-        mutation collectionDelete($input: CollectionDeleteInput!) {
-          collectionDelete(input: $input) {
-            deletedCollectionId
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
         variables = {"input": {"id": collection_gid}}
-        response = self.graphql(mutation, variables)
+        response = self.graphql(_M_COLLECTION_DELETE, variables)
         
         # Check for errors
         data = response.get("data", {}).get("collectionDelete", {})
@@ -226,26 +709,6 @@ class ShopifyClient:
         """
         print("Fetching all ACTIVE smart collection objects (ID, Title, Handle, specific Publications)...")
         collections = []
-        # Query is parameterized with the publication IDs AND status:active
-        query = """
-        query getSmartCollections($cursor: String, $storePubId: ID!, $posPubId: ID!) {
-          collections(first: 100, after: $cursor, query: "collection_type:smart AND status:active") {
-            edges {
-              cursor
-              node {
-                id
-                title
-                handle
-                isPublishedOnStore: publishedOnPublication(publicationId: $storePubId)
-                isPublishedOnPOS: publishedOnPublication(publicationId: $posPubId)
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
         # Add the IDs to the variables
@@ -255,7 +718,7 @@ class ShopifyClient:
             if cursor:
                 variables["cursor"] = cursor
             
-            response = self.graphql(query, variables)
+            response = self.graphql(_Q_SMART_COLLECTIONS_WITH_PUBLICATIONS, variables)
             
             if 'errors' in response:
                 print("❌ GraphQL API returned errors:")
@@ -289,22 +752,6 @@ class ShopifyClient:
         publication_map = {}
         target_names = {name.lower() for name in names}
         
-        query = """
-        query getPublications($cursor: String) {
-          publications(first: 25, after: $cursor) {
-            edges {
-              cursor
-              node {
-                id
-                name
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
         variables = {}
@@ -313,7 +760,7 @@ class ShopifyClient:
             if cursor:
                 variables["cursor"] = cursor
             
-            response = self.graphql(query, variables)
+            response = self.graphql(_Q_PUBLICATIONS, variables)
             if 'errors' in response:
                 print("❌ GraphQL API returned errors fetching publications:")
                 for error in response['errors']:
@@ -347,24 +794,6 @@ class ShopifyClient:
         publication_inputs is the list of {publicationId: "gid"} to ADD.
         """
         
-        mutation = """
-        mutation publishablePublish($id: ID!, $input: [PublicationInput!]!, $storePubId: ID!, $posPubId: ID!) {
-          publishablePublish(id: $id, input: $input) {
-            publishable {
-              ... on Collection {
-                id
-                # Re-check the status *after* the mutation
-                isPublishedOnStore: publishedOnPublication(publicationId: $storePubId)
-                isPublishedOnPOS: publishedOnPublication(publicationId: $posPubId)
-              }
-            }
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
         variables = {
             "id": collection_gid,
             "input": publication_inputs, # This is the list of channels to ADD
@@ -372,7 +801,7 @@ class ShopifyClient:
             "posPubId": pos_pub_id
         }
         
-        response = self.graphql(mutation, variables)
+        response = self.graphql(_M_PUBLISHABLE_PUBLISH, variables)
         
         # Check for userErrors first
         data = response.get("data", {}).get("publishablePublish", {})
@@ -411,36 +840,6 @@ class ShopifyClient:
         """
         print(f"Fetching all products tagged with '{tag}' for QA...")
         products = []
-        query = """
-        query getProductsForQA($query: String!, $cursor: String) {
-          products(first: 100, after: $cursor, query: $query) {
-            edges {
-              cursor
-              node {
-                id
-                handle
-                tags
-                bodyHtml
-                images(first: 1) {
-                  edges { node { id } }
-                }
-                swatch_metafield: metafield(namespace: "altuzarra", key: "swatch_image") {
-                  value
-                }
-                details_metafield: metafield(namespace: "altuzarra", key: "details") {
-                  value
-                }
-                look_image_metafield: metafield(namespace: "altuzarra", key: "look_image") {
-                  value
-                }
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
         variables = {"query": f"tag:'{tag}'"}
@@ -449,7 +848,7 @@ class ShopifyClient:
             if cursor:
                 variables["cursor"] = cursor
             
-            response = self.graphql(query, variables)
+            response = self.graphql(_Q_PRODUCTS_FOR_QA, variables)
             
             if 'errors' in response:
                 print("❌ GraphQL API returned errors:")
@@ -484,33 +883,10 @@ class ShopifyClient:
             print("Fetching existing staged files from Shopify to prevent duplicates...")
             
         files_map = {}
-        paginated_query = """
-        query($cursor: String) {
-          files(first: 250, after: $cursor) {
-            edges {
-              cursor
-              node {
-                id
-                ... on GenericFile {
-                  url
-                }
-                ... on MediaImage {
-                  originalSource {
-                    url
-                  }
-                }
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
         while hasNextPage:
-            response = self.graphql(paginated_query, {"cursor": cursor})
+            response = self.graphql(_Q_FILES, {"cursor": cursor})
             
             if verbose:
                 print("\n--- Raw GraphQL Response for Files ---")
@@ -567,36 +943,10 @@ class ShopifyClient:
         """
         print("Fetching existing staged files with CDN URLs from Shopify...")
         files_map = {}
-        paginated_query = """
-        query($cursor: String) {
-          files(first: 250, after: $cursor) {
-            edges {
-              cursor
-              node {
-                id
-                ... on GenericFile {
-                  url
-                }
-                ... on MediaImage {
-                  image {           # <-- ADD THIS BLOCK
-                    url
-                  }                 # <-- ADD THIS BLOCK
-                  originalSource {
-                    url
-                  }
-                }
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
         while hasNextPage:
-            response = self.graphql(paginated_query, {"cursor": cursor})
+            response = self.graphql(_Q_FILES_WITH_URLS, {"cursor": cursor})
             
             if 'errors' in response:
                 print("❌ GraphQL API returned errors:")
@@ -669,18 +1019,7 @@ class ShopifyClient:
         if gid.startswith("gid://shopify/MediaImage/"):
             start = time.time()
             while True:
-                query = """
-                query resolveMediaImage($id: ID!) {
-                  node(id: $id) {
-                    ... on MediaImage {
-                      file {
-                        id
-                      }
-                    }
-                  }
-                }
-                """
-                resp = self.graphql(query, {"id": gid})
+                resp = self.graphql(_Q_RESOLVE_MEDIA_IMAGE, {"id": gid})
                 file_node = resp.get("data", {}).get("node", {}).get("file")
 
                 if file_node and file_node.get("id"):
@@ -716,14 +1055,35 @@ class ShopifyClient:
 
         Returns the created File GID.
         """
+        raw_gid = self._stage_and_create_file(file_path, alt, verbose=verbose)
+        if not raw_gid:
+            return None
+
+        # Wait until Shopify marks the file READY
+        self.wait_for_file_ready(raw_gid)
+        return raw_gid
+
+    def _stage_and_create_file(self, file_path: str, alt: str, verbose: bool = False) -> str | None:
+        """
+        Runs steps 1-3 of the upload flow (stagedUploadsCreate, PUT, fileCreate)
+        without waiting for the File to become READY.
+        Returns the raw File GID, or None if staging failed.
+        """
         file_path = os.path.abspath(file_path)
 
-        if not os.path.exists(file_path):
+        # Open once: the declared fileSize and the PUT payload come from the same handle
+        try:
+            with open(file_path, "rb") as f:
+                file_size = os.fstat(f.fileno()).st_size
+                file_bytes = f.read()
+        except FileNotFoundError:
             raise FileNotFoundError(f"Local file not found: {file_path}")
 
+        # Assert we are NOT uploading an empty payload
+        assert file_size > 0, "Refusing to upload an empty file payload"
+
         filename = os.path.basename(file_path)
-        mime_type = self._guess_mime_type(filename)
-        file_size = os.path.getsize(file_path)
+        mime_type = _guess_mime_type(os.path.splitext(filename)[1].lower())
         file_size_str = str(file_size)
         assert file_size_str.isdigit(), f"fileSize must be numeric string, got {file_size_str}"
 
@@ -731,24 +1091,6 @@ class ShopifyClient:
             print(f"  > [upload] Preparing staged upload for {filename} ({file_size} bytes)")
 
         # --- Step 1: stagedUploadsCreate ---
-        mutation = """
-        mutation stagedUploadsCreate($input: [StagedUploadInput!]!) {
-          stagedUploadsCreate(input: $input) {
-            stagedTargets {
-              url
-              resourceUrl
-              parameters {
-                name
-                value
-              }
-            }
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
         variables = {
             "input": [{
                 "filename": filename,
@@ -758,7 +1100,7 @@ class ShopifyClient:
             }]
         }
 
-        resp = self.graphql(mutation, variables)
+        resp = self.graphql(_M_STAGED_UPLOADS_CREATE, variables)
         raw_data = resp.get("data", {}).get("stagedUploadsCreate")
 
         # --- HARDENED RESPONSE HANDLING ---
@@ -809,24 +1151,15 @@ class ShopifyClient:
         # so we must perform a plain PUT of the file bytes with NO custom headers.
 
         # One-line signed-headers sanity log (helps prevent regressions)
-        m = re.search(r"[?&]X-Goog-SignedHeaders=([^&]+)", upload_url)
+        m = _SIGNED_HEADERS_RE.search(upload_url)
         signed_headers = m.group(1) if m else "(missing)"
         if verbose:
             print(f"  > [upload] SignedHeaders={signed_headers}")
         if signed_headers != "host":
             raise RuntimeError(f"Unexpected X-Goog-SignedHeaders={signed_headers} (expected 'host')")
 
-        # Read bytes and assert we are NOT uploading an empty payload
-        with open(file_path, "rb") as f:
-            file_bytes = f.read()
-
-        assert len(file_bytes) == file_size, (
-            f"Read {len(file_bytes)} bytes from disk but os.path.getsize reported {file_size} bytes"
-        )
-        assert len(file_bytes) > 0, "Refusing to upload an empty file payload"
-
         if verbose:
-            print(f"  > [upload] PUT {len(file_bytes)} bytes to staged target (no headers)")
+            print(f"  > [upload] PUT {file_size} bytes to staged target (no headers)")
 
         # DO NOT pass any headers (especially x-goog-*)
         from requests import Request, Session
@@ -854,20 +1187,6 @@ class ShopifyClient:
         if verbose:
             print(f"  > [upload] Creating Shopify File record")
 
-        mutation = """
-        mutation fileCreate($files: [FileCreateInput!]!) {
-          fileCreate(files: $files) {
-            files {
-              id
-              fileStatus
-            }
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
         variables = {
             "files": [{
                 "alt": alt,
@@ -876,7 +1195,7 @@ class ShopifyClient:
             }]
         }
 
-        resp = self.graphql(mutation, variables)
+        resp = self.graphql(_M_FILE_CREATE, variables)
         fc = resp.get("data", {}).get("fileCreate", {})
 
         if fc.get("userErrors"):
@@ -884,9 +1203,6 @@ class ShopifyClient:
 
         raw_gid = fc["files"][0]["id"]
 
-        # Wait until Shopify marks the file READY
-        self.wait_for_file_ready(raw_gid)
-
         # NOTE:
         # Do NOT enforce gid://shopify/File/.
         # Shopify does not guarantee the GID type returned by fileCreate.
@@ -898,13 +1214,6 @@ class ShopifyClient:
             print(f"  > [upload] Created file GID: {raw_gid}")
         return raw_gid
 
-    def _guess_mime_type(self, filename: str) -> str:
-        if filename.lower().endswith(".png"):
-            return "image/png"
-        if filename.lower().endswith(".jpg") or filename.lower().endswith(".jpeg"):
-            return "image/jpeg"
-        return "application/octet-stream"
-
     def upload_file(self, resource_url: str, alt: str) -> str:
         """
         DEPRECATED.
@@ -916,169 +1225,186 @@ class ShopifyClient:
         
     def wait_for_file_ready(self, file_gid: str, timeout: int = 60) -> str:
         # Polls until the file is READY and returns the canonical CDN URL (no query params).
-        print(f"  > Waiting for file {file_gid} to be 'READY'...")
-        start_time = time.time()
-        
-        query = """
-        query checkFileStatus($id: ID!) {
-          node(id: $id) {
-            ... on File {
-              fileStatus
-              ... on MediaImage {
-                image {
-                  url
-                }
-                originalSource { url }
-              }
-              ... on GenericFile {
-                url
-              }
-            }
-          }
-        }
+        # Kept for back-compat; routes through the batched poller.
+        return self.wait_for_files_ready([file_gid], timeout=timeout)[file_gid]
+
+    def wait_for_files_ready(self, file_gids: list, timeout: int = 60) -> dict:
         """
-        variables = {"id": file_gid}
-        
-        while time.time() - start_time < timeout:
-            resp = self.graphql(query, variables)
-            node = resp.get("data", {}).get("node", {})
-            
-            if not node:
-                raise RuntimeError(f"Could not find file {file_gid} during polling.")
+        Polls a set of Files with a single nodes(ids:) query per cycle until
+        all are READY. Returns a map of {file_gid: cdn_url} (no query params).
+        Raises if any file FAILS, cannot be found, or the timeout is reached.
+        """
+        pending = list(dict.fromkeys(file_gids))
+        print(f"  > Waiting for {len(pending)} file(s) to be 'READY'...")
+        start_time = time.time()
+        ready_urls = {}
 
-            status = node.get("fileStatus")
-            
-            if status == "READY":
-                cdn_url = None
-                
-                # 1. Try to get the canonical MediaImage URL (e.g., cdn.shopify.com/...)
-                if "image" in node and node["image"] and "url" in node["image"]:
-                    cdn_url = node["image"]["url"]
-                
-                # 2. Fallback to GenericFile URL (for non-image files)
-                elif "url" in node and node["url"]:
-                    cdn_url = node["url"]
-                
-                # 3. Fallback to originalSource (old behavior, wrong URL)
-                elif "originalSource" in node and node["originalSource"] and "url" in node["originalSource"]:
-                    cdn_url = node["originalSource"]["url"]
-                    print(f"  > ⚠️  File is 'READY' but using originalSource URL.")
-
-                if cdn_url:
-                    print(f"  > File is 'READY'.")
-                    # Strip query params like ?v=... from the final URL
-                    return cdn_url.split('?')[0]
-                else:
-                    raise RuntimeError(f"File {file_gid} is READY but no URL was found.")
-
-            elif status == "FAILED":
-                raise RuntimeError(f"File processing FAILED for {file_gid}.")
-            
-            time.sleep(2)
-        
-        raise TimeoutError(f"Timed out waiting for file {file_gid} to become ready.")
+
+        while pending and time.time() - start_time < timeout:
+            resp = self.graphql(_Q_CHECK_FILES_STATUS, {"ids": pending})
+            if resp.get("errors"):
+                raise RuntimeError(f"File status poll failed: {resp['errors']}")
+            try:
+                nodes = resp["data"]["nodes"] or []
+            except (KeyError, TypeError):
+                nodes = []
+            # nodes(ids:) answers one entry per id; anything else would leave
+            # files silently unchecked until the timeout
+            if len(nodes) != len(pending):
+                raise RuntimeError(
+                    f"File status poll returned {len(nodes)} node(s) for {len(pending)} file(s): {resp}"
+                )
+
+            for file_gid, node in zip(pending, nodes):
+                if not node:
+                    raise RuntimeError(f"Could not find file {file_gid} during polling.")
+
+                status = node.get("fileStatus")
+
+                if status == "READY":
+                    cdn_url = None
+
+                    # 1. Try to get the canonical MediaImage URL (e.g., cdn.shopify.com/...)
+                    if "image" in node and node["image"] and "url" in node["image"]:
+                        cdn_url = node["image"]["url"]
+
+                    # 2. Fallback to GenericFile URL (for non-image files)
+                    elif "url" in node and node["url"]:
+                        cdn_url = node["url"]
+
+                    # 3. Fallback to originalSource (old behavior, wrong URL)
+                    elif "originalSource" in node and node["originalSource"] and "url" in node["originalSource"]:
+                        cdn_url = node["originalSource"]["url"]
+                        print(f"  > ⚠️  File {file_gid} is 'READY' but using originalSource URL.")
+
+                    if cdn_url:
+                        # Strip query params like ?v=... from the final URL
+                        ready_urls[file_gid] = cdn_url.split('?')[0]
+                    else:
+                        raise RuntimeError(f"File {file_gid} is READY but no URL was found.")
+
+                elif status == "FAILED":
+                    raise RuntimeError(f"File processing FAILED for {file_gid}.")
+
+            pending = [gid for gid in pending if gid not in ready_urls]
+            if pending:
+                time.sleep(2)
+
+        if pending:
+            raise TimeoutError(f"Timed out waiting for file(s) {', '.join(pending)} to become ready.")
+
+        print(f"  > {len(ready_urls)} file(s) 'READY'.")
+        return ready_urls
 
     def get_product_metafield(self, product_gid: str, key: str, namespace: str = "altuzarra") -> str | None:
         """
         Fetch the value of a single product metafield by namespace/key.
         Returns the metafield value string, or None if not set.
+        Successful results are cached for the life of the client; writes
+        through set_product_metafield / set_string_metafield invalidate them.
         """
-        query = """
-        query getProductMetafield($id: ID!, $namespace: String!, $key: String!) {
-          node(id: $id) {
-            ... on Product {
-              metafield(namespace: $namespace, key: $key) {
-                value
-              }
-            }
-          }
-        }
-        """
+        cache_key = ("metafield", product_gid, namespace, key)
+        hit, cached = self._cache_get(cache_key)
+        if hit:
+            return cached
+
         variables = {
             "id": product_gid,
             "namespace": namespace,
             "key": key,
         }
 
-        resp = self.graphql(query, variables)
+        resp = self.graphql(_Q_PRODUCT_METAFIELD, variables)
 
-        node = resp.get("data", {}).get("node")
-        if not node:
-            return None
-
-        metafield = node.get("metafield")
-        if not metafield:
-            return None
+        value = None
+        node = (resp.get("data") or {}).get("node")
+        if node and node.get("metafield"):
+            value = node["metafield"].get("value")
 
-        return metafield.get("value")
+        # Only a clean response is cached; an errored or throttled one must not
+        # read as "metafield not set" on later calls
+        if resp.get("data") is not None and not resp.get("errors"):
+            self._cache_put(cache_key, value)
+        return value
 
     def set_product_metafield(self, product_gid: str, key: str, value_gid: str, namespace: str = "altuzarra", field_type: str = "file_reference"):
-        # ... (This function can remain as-is) ...
-        mutation = """
-        mutation metafieldsSet($metafields: [MetafieldsSetInput!]!) {
-          metafieldsSet(metafields: $metafields) {
-            metafields { key namespace type value }
-            userErrors { field message }
-          }
-        }"""
         variables = {"metafields": [{"ownerId": product_gid, "namespace": namespace, "key": key, "type": field_type, "value": value_gid}]}
-        return self.graphql(mutation, variables)
+        resp = self.graphql(_M_METAFIELDS_SET, variables)
+        self.invalidate_cache(product_gid=product_gid, key=key)
+        return resp
+
+    def set_product_metafields_bulk(self, inputs: list) -> list:
+        """
+        Writes up to 25 MetafieldsSetInput dicts in one metafieldsSet call.
+        Returns a list parallel to `inputs` holding None on success or the
+        error message for that input.
+        """
+        if len(inputs) > 25:
+            raise ValueError(f"metafieldsSet accepts at most 25 inputs, got {len(inputs)}")
+
+        response = self.graphql(_M_METAFIELDS_SET, {"metafields": inputs})
+        for mf in inputs:
+            self.invalidate_cache(product_gid=mf.get("ownerId"), key=mf.get("key"))
+
+        if 'errors' in response:
+            message = f"GraphQL Error: {response['errors']}"
+            return [message] * len(inputs)
+
+        results = [None] * len(inputs)
+        user_errors = (response.get("data") or {}).get("metafieldsSet", {}).get("userErrors") or []
+        for err in user_errors:
+            # field looks like ["metafields", "<index>", "value"]
+            field = err.get("field") or []
+            if len(field) >= 2 and str(field[1]).isdigit() and int(field[1]) < len(inputs):
+                results[int(field[1])] = err.get("message")
+            else:
+                # Not attributable to one input; fail the whole batch
+                results = [r or err.get("message") for r in results]
+        return results
 
     def create_smart_collection(self, title: str, tag: str) -> dict:
-        # ... (This function can remain as-is) ...
-        mutation = """
-        mutation collectionCreate($input: CollectionInput!) {
-          collectionCreate(input: $input) {
-            collection { id handle title }
-            userErrors { field message }
-          }
-        }"""
         variables = {"input": {"title": title, "handle": title.lower().replace(" ", "-"), "ruleSet": {"appliedDisjunctively": False, "rules": [{"column": "TAG", "relation": "EQUALS", "condition": tag}]}, "sortOrder": "BEST_SELLING"}}
-        return self.graphql(mutation, variables)
+        return self.graphql(_M_COLLECTION_CREATE, variables)
     
     # ------------------------------------------------------------------
     # --- Size Guide Functions (Used by other scripts) ---
     # ------------------------------------------------------------------
 
-    def get_size_guide_pages_map(self) -> dict:
-        # ... (This function can remain as-is) ...
+    def get_size_guide_pages_map(self, raise_on_error: bool = False) -> dict:
+        """
+        {product_type: page_gid} for every 'Size Guide' page. With
+        raise_on_error=True an errored page raises IncompleteFetchError
+        (carrying the partial map) instead of returning it.
+        """
+        hit, cached = self._cache_get(("size_guide_pages",))
+        if hit:
+            return dict(cached)
+
         print("Fetching all pages from Shopify to find 'Size Guides'...")
         page_map = {}
-        query = """
-        query getPages($cursor: String) {
-          pages(first: 250, after: $cursor) {
-            edges {
-              cursor
-              node {
-                id
-                title
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
-        variables = {} 
-        
+        # Filter server-side; the startswith check below stays as a safety net.
+        variables = {"query": "title:Size\\ Guide*"}
+        errored = False # An errored page leaves the map incomplete: don't cache it
+
         while hasNextPage:
             if cursor:
                 variables["cursor"] = cursor
             
-            response = self.graphql(query, variables)
+            response = self.graphql(_Q_SIZE_GUIDE_PAGES, variables)
             
             if 'errors' in response:
                 print("❌ GraphQL API returned errors fetching pages:")
                 for error in response['errors']:
                     print(f"  - {error.get('message')}")
+                errored = True
                 break
             
             data = response.get("data", {}).get("pages", {})
             if data is None:
                 print("⚠️  Warning: The 'pages' key was not found. (Missing 'read_online_store_pages' scope?)")
+                errored = True
                 break
 
             for edge in data.get("edges", []):
@@ -1090,127 +1416,124 @@ class ShopifyClient:
                     
                     if product_type:
                         page_map[product_type] = node["id"]
-                cursor = edge.get("cursor")
             
-            hasNextPage = data.get("pageInfo", {}).get("hasNextPage", False)
+            page_info = data.get("pageInfo", {})
+            hasNextPage = page_info.get("hasNextPage", False)
+            cursor = page_info.get("endCursor")
             
         print(f"Found {len(page_map)} size guide pages and mapped them to product types.")
+        if errored:
+            if raise_on_error:
+                raise IncompleteFetchError("size guide page fetch stopped on an error", page_map)
+        else:
+            self._cache_put(("size_guide_pages",), dict(page_map), ttl=_LIST_CACHE_TTL)
         return page_map
     
-    def get_products_with_type(self, tag: str) -> list:
-        # ... (This function can remain as-is) ...
+    def get_products_with_type(self, tag: str, raise_on_error: bool = False) -> list:
+        """
+        Products tagged with 'tag', with their productType. With
+        raise_on_error=True an errored page raises IncompleteFetchError
+        (carrying the partial list) instead of returning it.
+        """
+        hit, cached = self._cache_get(("products_with_type", tag))
+        if hit:
+            return list(cached)
+
         print(f"Fetching all products and types for capsule '{tag}'...")
         products = []
-        query = """
-        query getProductsWithType($query: String!, $cursor: String) {
-          products(first: 250, after: $cursor, query: $query) {
-            edges {
-              cursor
-              node {
-                id
-                handle
-                productType
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
         hasNextPage = True
         cursor = None
         variables = {"query": f"tag:'{tag}'"}
-        
+        errored = False # An errored page leaves the list incomplete: don't cache it
+
         while hasNextPage:
             if cursor:
                 variables["cursor"] = cursor
             
-            response = self.graphql(query, variables)
+            response = self.graphql(_Q_PRODUCTS_WITH_TYPE, variables)
             
             if 'errors' in response:
                 print("❌ GraphQL API returned errors fetching products:")
                 for error in response['errors']:
                     print(f"  - {error.get('message')}")
+                errored = True
                 break
             
             data = response.get("data", {}).get("products", {})
             if data is None:
                 print("⚠️  Warning: The 'products' key was not found.")
+                errored = True
                 break
 
             for edge in data.get("edges", []):
                 products.append(edge.get("node", {}))
-                cursor = edge.get("cursor")
             
-            hasNextPage = data.get("pageInfo", {}).get("hasNextPage", False)
+            page_info = data.get("pageInfo", {})
+            hasNextPage = page_info.get("hasNextPage", False)
+            cursor = page_info.get("endCursor")
             
         print(f"Found {len(products)} products in capsule '{tag}'.")
+        if errored:
+            if raise_on_error:
+                raise IncompleteFetchError(f"product fetch for '{tag}' stopped on an error", products)
+        else:
+            self._cache_put(("products_with_type", tag), list(products), ttl=_LIST_CACHE_TTL)
         return products
 
     # ------------------------------------------------------------------
     # --- NEW FUNCTIONS FOR PRODUCT UPSERTER ---
     # ------------------------------------------------------------------
     
-    def get_products_for_upsert(self, tag: str, verbose: bool = False) -> dict:
+    def get_products_for_upsert(self, tag: str, verbose: bool = False, handles: list | None = None) -> dict:
         """
         Fetches all products for a given tag and returns a map of
         {handle: {'gid': '...', 'media_gids': [...]}}.
+
+        If `handles` is given, only those products are fetched, using
+        handle:... OR handle:... search clauses in batches of 50.
         """
         if verbose:
             print(f"Fetching product GIDs, handles, and media for tag '{tag}'...")
         product_map = {}
-        query = """
-        query getProductsForUpsert($query: String!, $cursor: String) {
-          products(first: 100, after: $cursor, query: $query) {
-            edges {
-              cursor
-              node {
-                id
-                handle
-                media(first: 50) {
-                  edges {
-                    node {
-                      id
-                    }
-                  }
-                }
-              }
-            }
-            pageInfo {
-              hasNextPage
-            }
-          }
-        }
-        """
-        hasNextPage = True
-        cursor = None
-        variables = {"query": f"tag:'{tag}'"}
-        
-        while hasNextPage:
-            if cursor:
-                variables["cursor"] = cursor
-            
-            response = self.graphql(query, variables)
-            data = response.get("data", {}).get("products", {})
-            
-            for edge in data.get("edges", []):
-                node = edge.get("node", {})
-                if node.get("handle") and node.get("id"):
-                    
-                    # Extract the list of media GIDs
-                    media_gids = [
-                        media_edge['node']['id'] 
-                        for media_edge in node.get('media', {}).get('edges', [])
-                    ]
-                    
-                    product_map[node["handle"]] = {
-                        "gid": node["id"],
-                        "media_gids": media_gids
-                    }
-                cursor = edge.get("cursor")
-            
-            hasNextPage = data.get("pageInfo", {}).get("hasNextPage", False)
+        if handles is None:
+            search_queries = [f"tag:'{tag}'"]
+        else:
+            unique_handles = list(dict.fromkeys(handles))
+            search_queries = []
+            for i in range(0, len(unique_handles), 50):
+                or_clause = " OR ".join(f"handle:{h}" for h in unique_handles[i:i + 50])
+                search_queries.append(f"tag:'{tag}' AND ({or_clause})")
+
+        for search_query in search_queries:
+            hasNextPage = True
+            cursor = None
+            variables = {"query": search_query}
+
+            while hasNextPage:
+                if cursor:
+                    variables["cursor"] = cursor
+
+                response = self.graphql(_Q_PRODUCTS_FOR_UPSERT, variables)
+                data = response.get("data", {}).get("products", {})
+
+                for edge in data.get("edges", []):
+                    node = edge.get("node", {})
+                    if node.get("handle") and node.get("id"):
+
+                        # Extract the list of media GIDs
+                        media_gids = [
+                            media_edge['node']['id']
+                            for media_edge in node.get('media', {}).get('edges', [])
+                        ]
+
+                        product_map[node["handle"]] = {
+                            "gid": node["id"],
+                            "media_gids": media_gids
+                        }
+
+                page_info = data.get("pageInfo", {})
+                hasNextPage = page_info.get("hasNextPage", False)
+                cursor = page_info.get("endCursor")
             
         if verbose:
             print(f"Found {len(product_map)} products.")
@@ -1221,17 +1544,6 @@ class ShopifyClient:
         Deletes all specified media from a product using the
         productDeleteMedia mutation.
         """
-        mutation = """
-        mutation productDeleteMedia($productId: ID!, $mediaIds: [ID!]!) {
-          productDeleteMedia(productId: $productId, mediaIds: $mediaIds) {
-            deletedMediaIds
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
         variables = {"productId": product_gid, "mediaIds": media_gids}
 
         if dry_run:
@@ -1240,7 +1552,7 @@ class ShopifyClient:
                 print(json.dumps(variables, indent=4))
             return
             
-        response = self.graphql(mutation, variables)
+        response = self.graphql(_M_PRODUCT_DELETE_MEDIA, variables)
         
         if 'errors' in response:
             raise RuntimeError(f"GraphQL Error: {response['errors']}")
@@ -1267,20 +1579,6 @@ class ShopifyClient:
             for gid in file_gids
         ]
         
-        mutation = """
-        mutation productCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
-          productCreateMedia(productId: $productId, media: $media) {
-            media {
-              id
-              status
-            }
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
         variables = {"productId": product_gid, "media": media_input_list}
 
         if dry_run:
@@ -1289,7 +1587,7 @@ class ShopifyClient:
                 print(json.dumps(variables, indent=4))
             return
             
-        response = self.graphql(mutation, variables)
+        response = self.graphql(_M_PRODUCT_CREATE_MEDIA, variables)
         
         if 'errors' in response:
             raise RuntimeError(f"GraphQL Error: {response['errors']}")
@@ -1320,63 +1618,69 @@ class ShopifyClient:
 
         start_time = time.time()
         timeout = 120 # 2 minutes
-        pending_ids = set(media_ids_to_poll)
-        failed_ids = set()
-        ready_ids = set()
-
-        poll_query = """
-        query checkMediaStatus($ids: [ID!]!) {
-            nodes(ids: $ids) {
-            ... on MediaImage {
-                id
-                status
-            }
-            }
-        }
-        """
+        # Single status map; ready/failed views are derived after the loop
+        statuses = {mid: 'PENDING' for mid in media_ids_to_poll}
+        pending_ids = list(statuses)
+
         
+        # Poll immediately (files from wait_for_files_ready are usually READY
+        # already), then back off exponentially: 0.5s, 1s, 2s, 4s, 4s, ...
+        delay = 0.0
         while pending_ids and (time.time() - start_time < timeout):
-            time.sleep(3) # Wait between polls
+            if delay:
+                time.sleep(delay) # Wait between polls
+            delay = min(max(delay * 2, 0.5), 4.0)
             try:
-                poll_resp = self.graphql(poll_query, {"ids": list(pending_ids)})
-                nodes = poll_resp.get("data", {}).get("nodes", [])
+                poll_resp = self.graphql(_Q_CHECK_MEDIA_STATUS, {"ids": pending_ids})
+                try:
+                    nodes = poll_resp["data"]["nodes"] or []
+                except (KeyError, TypeError):
+                    nodes = []
 
                 if not nodes:
                         if verbose: print("  > Polling: No node data returned yet...")
                         continue
 
+                transitioned = False
                 for node in nodes:
-                    if not node or 'id' not in node or 'status' not in node:
-                            continue
-
-                    media_id = node['id']
-                    status = node['status']
+                    try:
+                        media_id = node['id']
+                        status = node['status']
+                    except (KeyError, TypeError):
+                        continue
                     
-                    if media_id not in pending_ids:
+                    if statuses.get(media_id) != 'PENDING':
                         continue 
 
                     if status == 'READY':
-                        ready_ids.add(media_id)
-                        pending_ids.remove(media_id)
+                        statuses[media_id] = 'READY'
+                        transitioned = True
                     elif status == 'FAILED':
-                        failed_ids.add(media_id)
-                        pending_ids.remove(media_id)
+                        statuses[media_id] = 'FAILED'
+                        transitioned = True
                         if verbose: print(f"    - {media_id} -> FAILED")
                     elif status == 'PROCESSING' or status == 'UPLOADING':
                         pass # Still waiting
                     else:
                         print(f"    - {media_id} -> UNEXPECTED STATUS: {status}")
-                        failed_ids.add(media_id)
-                        pending_ids.remove(media_id)
+                        statuses[media_id] = 'FAILED'
+                        transitioned = True
+
+                # Reuse the same ids list across polls until something transitions
+                if transitioned:
+                    pending_ids = [mid for mid, st in statuses.items() if st == 'PENDING']
 
             except Exception as poll_e:
                 print(f"  > ❌ Error during media status polling: {poll_e}")
                 break 
 
         # --- REPORTING ---
+        pending_ids = [mid for mid, st in statuses.items() if st == 'PENDING']
         if pending_ids: # Timed out
                 print(f"  > ⚠️ Timeout: {len(pending_ids)} media items did not become READY or FAILED within {timeout}s.")
-                failed_ids.update(pending_ids)
+
+        ready_ids = [mid for mid, st in statuses.items() if st == 'READY']
+        failed_ids = [mid for mid, st in statuses.items() if st != 'READY']
 
         if failed_ids:
                 raise RuntimeError(f"Media Create Failed: {len(failed_ids)} media item(s) failed processing. Failed IDs: {', '.join(failed_ids)}")
@@ -1385,27 +1689,33 @@ class ShopifyClient:
                 print(f"  > 🖼️  Successfully processed {len(ready_ids)} new media items.")
         # --- END POLLING LOGIC ---
 
+    def replace_product_media(self, product_gid: str, old_media_gids: list, new_file_gids: list, dry_run: bool = False, verbose: bool = False):
+        """
+        Replaces a product's media with media created from `new_file_gids`
+        (File GIDs or final Shopify CDN URLs).
+
+        Skips the round-trips entirely when there is nothing to delete and
+        nothing to create, and only issues the mutation(s) actually needed.
+        productUpdate's media input is additive, so a true replace is still
+        productDeleteMedia followed by productCreateMedia.
+        """
+        if not old_media_gids and not new_file_gids:
+            if verbose:
+                print("  > ℹ️  No existing or new media; nothing to replace.")
+            return
+
+        if old_media_gids:
+            self.delete_product_media(product_gid, old_media_gids, dry_run, verbose=verbose)
+
+        if new_file_gids:
+            self.create_product_media(product_gid, new_file_gids, dry_run, verbose=verbose)
+
     def update_product(self, product_input: dict, dry_run: bool = False, verbose: bool = False):
         """
         Performs a productUpdate mutation.
         The input_payload must be a dict containing the product 'id'
         and any fields to update (e.g., 'tags').
         """
-        mutation = """
-        mutation productUpdate($input: ProductInput!) {
-          productUpdate(input: $input) {
-            product {
-              id
-              handle
-              tags
-            }
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
         variables = {"input": product_input}
 
         if dry_run:
@@ -1414,7 +1724,7 @@ class ShopifyClient:
                 print(json.dumps(variables, indent=4))
             return
             
-        response = self.graphql(mutation, variables)
+        response = self.graphql(_M_PRODUCT_UPDATE, variables)
         
         if 'errors' in response:
             raise RuntimeError(f"GraphQL Error: {response['errors']}")
@@ -1434,22 +1744,6 @@ class ShopifyClient:
         """
         Sets a 'string' type metafield on any object (e.g., Product).
         """
-        mutation = """
-        mutation metafieldsSet($metafields: [MetafieldsSetInput!]!) {
-          metafieldsSet(metafields: $metafields) {
-            metafields {
-              id
-              key
-              namespace
-              value
-            }
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
         metafield_input = {
             "ownerId": owner_gid,
             "namespace": namespace,
@@ -1465,7 +1759,8 @@ class ShopifyClient:
                 print(json.dumps(variables, indent=4))
             return
 
-        response = self.graphql(mutation, variables)
+        response = self.graphql(_M_METAFIELDS_SET_STRING, variables)
+        self.invalidate_cache(product_gid=owner_gid, key=key)
 
         if 'errors' in response:
             raise RuntimeError(f"GraphQL Error: {response['errors']}")
@@ -11,25 +11,45 @@ Filters the product list based on a provided --capsule tag and a
 
 import argparse
 import json
-import pandas as pd
 import pathlib
 import re
-from api.shopify_client import ShopifyClient
-from utils.state_gate import StateGate
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.csv_options import CSV_ENGINE, STRING_DTYPE
+from utils.state_gate import StateGate, load_typed_products, load_state_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# metafieldsSet accepts at most 25 inputs per call
+METAFIELD_BATCH_SIZE = 25
+# Concurrent metafieldsSet calls; the client backs off on throttleStatus
+MAX_WORKERS = 4
+# How long cached Shopify reads under capsules/{capsule}/cache/ stay valid
+CACHE_TTL_SECONDS = 15 * 60
 
 def load_authorized_products_from_state(capsule: str) -> dict:
     """Load authorized products from state file for the capsule.
 
-    Returns a dict of {handle: product_state_dict}
-    where allowed_actions.size_guide_write == True.
+    Returns a dict of {handle: product_state} (a ProductState when msgspec
+    is available, else the raw dict) where allowed_actions.size_guide_write == True.
     """
     state_file = pathlib.Path(f"capsules/{capsule}/state/product_state_{capsule}.json")
     if not state_file.exists():
         print(f"Error: State file not found at {state_file}")
         exit(1)
 
-    with open(state_file, 'r') as f:
-        state_data = json.load(f)
+    typed_products = load_typed_products(state_file)
+    if typed_products is not None:
+        return {
+            handle: product for handle, product in typed_products.items()
+            if product.allowed_actions and product.allowed_actions.get("size_guide_write") is True
+        }
+
+    state_data = load_state_json(state_file)
 
     products = state_data.get("products", {})
     if not isinstance(products, dict):
@@ -49,11 +69,16 @@ def load_authorized_products_from_state(capsule: str) -> dict:
 
 def extract_handles_from_csv(csv_path: pathlib.Path) -> set[str]:
     """Extract unique non-null handles from the CSV's 'Handle' column."""
+    # pandas is imported lazily so `--help` and early exits stay fast
+    import pandas as pd
+
     try:
-        df = pd.read_csv(csv_path)
-        if 'Handle' not in df.columns:
+        # Only the Handle column is needed; skip parsing the rest of the export
+        header = pd.read_csv(csv_path, nrows=0).columns
+        if 'Handle' not in header:
             print(f"Error: CSV file must contain a 'Handle' column.")
             exit(1)
+        df = pd.read_csv(csv_path, usecols=['Handle'], dtype=STRING_DTYPE, engine=CSV_ENGINE)
         handles = set(df['Handle'].dropna().unique())
         return handles
     except FileNotFoundError:
@@ -63,7 +88,38 @@ def extract_handles_from_csv(csv_path: pathlib.Path) -> set[str]:
         print(f"Error reading CSV: {e}")
         exit(1)
 
-def main(capsule: str, source_csv: str, dry_run: bool = False):
+def cached_fetch(capsule: str, name: str, fetch, refresh: bool = False):
+    """
+    Return fetch(), reusing capsules/{capsule}/cache/{name}.json while it is
+    younger than CACHE_TTL_SECONDS (refresh=True always re-fetches).
+
+    Only a complete, non-empty result is written back: `fetch` raises
+    IncompleteFetchError when it stopped on an error, and that partial
+    result is used for this run without being cached.
+    """
+    from api.shopify_client import IncompleteFetchError
+
+    cache_file = pathlib.Path(f"capsules/{capsule}/cache/{name}.json")
+    if not refresh and cache_file.exists() and time.time() - cache_file.stat().st_mtime < CACHE_TTL_SECONDS:
+        print(f"[CACHE_HIT] {cache_file}")
+        raw = cache_file.read_bytes()
+        return orjson.loads(raw) if orjson else json.loads(raw)
+
+    try:
+        result = fetch()
+    except IncompleteFetchError as e:
+        print(f"[CACHE_SKIP] {cache_file} | {e}")
+        return e.partial
+    if not result:
+        print(f"[CACHE_SKIP] {cache_file} | empty result")
+        return result
+
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    cache_file.write_bytes(orjson.dumps(result) if orjson else json.dumps(result).encode("utf-8"))
+    return result
+
+def main(capsule: str, source_csv: str, dry_run: bool = False, refresh_cache: bool = False, verbose: bool = False):
+    from api.shopify_client import ShopifyClient
     client = ShopifyClient()
 
     # Load authorized products from state
@@ -73,38 +129,50 @@ def main(capsule: str, source_csv: str, dry_run: bool = False):
     # Load handles from CSV
     csv_handles = extract_handles_from_csv(pathlib.Path(source_csv))
 
-    # Audit authorization
+    # Audit authorization; handles to process are the intersection
+    handles_to_process = csv_handles & authorized_handles
+    skipped_handles = csv_handles - authorized_handles
     print("[STATE_AUDIT] size_guide authorization summary")
-    for handle in csv_handles:
-        if handle in authorized_handles:
-            print(f"[SIZE_GUIDE_ALLOW] {handle}")
-        else:
-            print(f"[SIZE_GUIDE_SKIP] {handle} | reason=allowed_actions.size_guide_write != true")
-
-    # Intersection of handles to process
-    handles_to_process = csv_handles.intersection(authorized_handles)
+    print(f"[SIZE_GUIDE_ALLOW_COUNT] {len(handles_to_process)}")
+    print(f"[SIZE_GUIDE_SKIP_COUNT] {len(skipped_handles)}")
+    if verbose:
+        sys.stdout.writelines(f"[SIZE_GUIDE_ALLOW] {h}\n" for h in sorted(handles_to_process))
+        sys.stdout.writelines(
+            f"[SIZE_GUIDE_SKIP] {h} | reason=allowed_actions.size_guide_write != true\n"
+            for h in sorted(skipped_handles)
+        )
 
     # Fetch all products for the capsule
-    all_capsule_products = client.get_products_with_type(capsule)
+    all_capsule_products = cached_fetch(
+        capsule, f"products_with_type_{capsule}",
+        lambda: client.get_products_with_type(capsule, raise_on_error=True), refresh_cache,
+    )
 
     # Build handle-to-product map
     product_map = {p['handle']: p for p in all_capsule_products}
 
+    # Handles not found in Shopify are skipped; report them once via set difference
+    missing_handles = handles_to_process - product_map.keys()
+    if missing_handles:
+        print(f"[NOT_FOUND] {len(missing_handles)} authorized handles not found in Shopify for capsule {capsule}")
+    handles_to_process = handles_to_process - missing_handles
+
     # Get all available Size Guide Pages
-    size_guide_map = client.get_size_guide_pages_map()
+    size_guide_map = cached_fetch(
+        capsule, "size_guide_pages",
+        lambda: client.get_size_guide_pages_map(raise_on_error=True), refresh_cache,
+    )
     if not size_guide_map:
         print("No size guide pages found on Shopify. Exiting.")
         return
 
     success_count = 0
     fail_count = 0
+    # Pending (handle, page_gid, MetafieldsSetInput) writes
+    pending = []
 
     for handle in handles_to_process:
-        product = product_map.get(handle)
-        if not product:
-            # Product not found in Shopify for this handle; skip silently
-            continue
-
+        product = product_map[handle]
         product_type = product.get('productType')
         product_gid = product.get('id')
 
@@ -117,19 +185,30 @@ def main(capsule: str, source_csv: str, dry_run: bool = False):
             print(f"[ATTACH] {handle} | page={page_gid}")
             success_count += 1
         else:
-            try:
-                client.set_product_metafield(
-                    product_gid=product_gid,
-                    key="size_guide_page",
-                    value_gid=page_gid,
-                    namespace="altuzarra",
-                    field_type="page_reference"
-                )
-                print(f"[ATTACH] {handle} | page={page_gid}")
-                success_count += 1
-            except Exception as e:
-                print(f"[ERROR] {handle} | {e}")
-                fail_count += 1
+            pending.append((handle, page_gid, {
+                "ownerId": product_gid,
+                "namespace": "altuzarra",
+                "key": "size_guide_page",
+                "type": "page_reference",
+                "value": page_gid,
+            }))
+
+    def write_batch(batch):
+        try:
+            return client.set_product_metafields_bulk([mf for _, _, mf in batch])
+        except Exception as e:
+            return [str(e)] * len(batch)
+
+    batches = [pending[i:i + METAFIELD_BATCH_SIZE] for i in range(0, len(pending), METAFIELD_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for batch, results in zip(batches, pool.map(write_batch, batches)):
+            for (handle, page_gid, _), error in zip(batch, results):
+                if error:
+                    print(f"[ERROR] {handle} | {error}")
+                    fail_count += 1
+                else:
+                    print(f"[ATTACH] {handle} | page={page_gid}")
+                    success_count += 1
 
     print("--- Size Guide Attachment Complete ---")
     print(f"✅ Success: {success_count} products")
@@ -140,6 +219,10 @@ if __name__ == "__main__":
     parser.add_argument('--capsule', required=True, help='Capsule name (e.g., "S126") to query products.')
     parser.add_argument('--source-csv', required=True, help='Path to the Shopify-exported CSV for handle discovery.')
     parser.add_argument('--dry-run', action='store_true', help='Run script without making any API changes.')
+    parser.add_argument('--no-cache', action='store_true', help='Re-fetch products and size guide pages from Shopify and refresh the cache.')
+
+    parser.add_argument('--verbose', action='store_true', help='Print the per-handle authorization audit.')
 
     args = parser.parse_args()
-    main(capsule=args.capsule, source_csv=args.source_csv, dry_run=args.dry_run)
\ No newline at end of file
+    main(capsule=args.capsule, source_csv=args.source_csv, dry_run=args.dry_run,
+         refresh_cache=args.no_cache, verbose=args.verbose)
\ No newline at end of file
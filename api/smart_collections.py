@@ -11,34 +11,41 @@ Usage:
 """
 
 import argparse
-import pandas as pd
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import pathlib
 import json
-from api.shopify_client import ShopifyClient
+from utils.csv_options import CSV_ENGINE, STRING_DTYPE
+from utils.state_gate import load_typed_products, load_state_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 def extract_unique_style_tags(csv_path: pathlib.Path) -> set:
     """
     Extracts all unique, non-blank tags starting with 'style_' from the 'Tags' column.
     """
+    # pandas is imported lazily so `--help` and early exits stay fast
+    import pandas as pd
+
     try:
-        df = pd.read_csv(csv_path)
+        # A missing 'Tags' column yields no tags rather than a usecols error
+        if "Tags" not in pd.read_csv(csv_path, nrows=0).columns:
+            return set()
+        # Only the Tags column is needed; skip parsing the rest of the export
+        df = pd.read_csv(csv_path, usecols=["Tags"], dtype=STRING_DTYPE, engine=CSV_ENGINE)
     except FileNotFoundError:
         print(f"❌ Error: File not found at {csv_path}")
         return set()
     except Exception as e:
         print(f"❌ Error reading CSV {csv_path}: {e}")
         return set()
-        
-    tags = set()
-    # Use .get() for safety, default to empty list if 'Tags' column is missing
-    for taglist in df.get("Tags", []):
-        if not isinstance(taglist, str):
-            continue
-        for tag in taglist.split(","):
-            t = tag.strip()
-            if t.startswith("style_") and t != "style_": # Ensure tag is not just 'style_'
-                tags.add(t)
-    return tags
+
+    s = df["Tags"].dropna().astype(str).str.split(",").explode().str.strip()
+    # Ensure tag is not just 'style_'
+    return set(s[s.str.startswith("style_") & (s != "style_")].unique())
 
 def load_authorized_styles_from_state(capsule: str) -> dict:
     """
@@ -56,9 +63,19 @@ def load_authorized_styles_from_state(capsule: str) -> dict:
         print(f"❌ Warning: State file not found at {state_path}")
         return {}
 
+    typed_products = load_typed_products(state_path)
+    if typed_products is not None:
+        authorized: dict[str, list[str]] = {}
+        for handle, product in typed_products.items():
+            if not (product.allowed_actions and product.allowed_actions.get("collection_write") is True):
+                continue
+            for tag in product.tags:
+                if tag.startswith("style_") and tag != "style_":
+                    authorized.setdefault(tag, []).append(handle)
+        return authorized
+
     try:
-        with open(state_path, "r") as f:
-            product_state = json.load(f)
+        product_state = load_state_json(state_path)
     except Exception as e:
         print(f"❌ Error loading state JSON: {e}")
         return {}
@@ -125,34 +142,39 @@ def main(
 
     authorized_style_map = load_authorized_styles_from_state(capsule)
 
-    print("[STATE_AUDIT] style authorization summary")
+    # One pass over the requested styles splits them into allow/skip
+    allow, skip = [], []
     for style in sorted(styles_to_create):
-        handles = authorized_style_map.get(style, [])
-        if handles:
-            print(
-                f"[STYLE_ALLOW] {style} | authorized_by={len(handles)} | handles={handles}"
-            )
-        else:
-            print(
-                f"[STYLE_SKIP] {style} | authorized_by=0 | reason=no product with allowed_actions.collection_write == true"
-            )
+        (allow if authorized_style_map.get(style) else skip).append(style)
+
+    print("[STATE_AUDIT] style authorization summary")
+    for style in allow:
+        handles = authorized_style_map[style]
+        print(
+            f"[STYLE_ALLOW] {style} | authorized_by={len(handles)} | handles={handles}"
+        )
+    for style in skip:
+        print(
+            f"[STYLE_SKIP] {style} | authorized_by=0 | reason=no product with allowed_actions.collection_write == true"
+        )
 
     print(f"Authorized styles from state: {len(authorized_style_map)}")
 
-    unauthorized = sorted(set(styles_to_create) - set(authorized_style_map))
-    for style in unauthorized:
+    for style in skip:
         print(f"[SKIP] {style} | no products authorize collection_write=true in product_state")
 
     if not authorized_style_map:
         print("⏭ No styles authorized for collection creation.")
         return
 
+    from api.shopify_client import ShopifyClient
     client = ShopifyClient()
     
     # Fetch all existing titles *before* the loop for an efficient single check
     try:
         print("Fetching all existing smart collection titles from Shopify...")
-        existing_titles = client.get_all_smart_collection_titles()
+        # Frozen once so every per-style membership check below is O(1)
+        existing_titles = frozenset(client.get_all_smart_collection_titles())
         print(f"  > Found {len(existing_titles)} existing collection titles.")
     except Exception as e:
         print(f"❌ FAILED to fetch existing collections: {e}")
@@ -160,37 +182,62 @@ def main(
         return
     
     api_results = [] # Use this list for logging
-    
+
     for style_tag, handles in sorted(authorized_style_map.items()):
         print(f"[ALLOW] {style_tag} | authorized by {len(handles)} product(s): {', '.join(handles)}")
 
-        # Check if a collection with this exact title already exists
-        if style_tag in existing_titles:
-            print(f"[NOOP] {style_tag} | collection already exists on Shopify")
-            continue # Skip to the next style_tag
+    # Styles whose collection (same exact title) already exists are no-ops
+    for style_tag in sorted(authorized_style_map.keys() & existing_titles):
+        print(f"[NOOP] {style_tag} | collection already exists on Shopify")
 
-        if dry_run:
+    to_create = sorted(authorized_style_map.keys() - existing_titles)
+
+    if dry_run:
+        for style_tag in to_create:
             print(f"[dry-run] Would create smart collection '{style_tag}'")
-            continue
+        to_create = []
 
+    def create(style_tag):
+        # Create the collection where title and tag are identical
         print(f"[CREATE] {style_tag} | creating smart collection")
         try:
-            # Create the collection where title and tag are identical
-            resp = client.create_smart_collection(title=style_tag, tag=style_tag)
-            api_results.append({"tag": style_tag, "status": "created", "response": resp})
-            print(f"[CREATE] {style_tag} | created successfully")
+            return style_tag, client.create_smart_collection(title=style_tag, tag=style_tag), None
         except Exception as e:
-            print(f"    ❌ FAILED to create '{style_tag}': {e}")
-            api_results.append({"tag": style_tag, "status": "failed", "response": {"error": str(e)}})
+            return style_tag, None, e
+
+    log_path = capsule_dir / "outputs/api_jobs" / f"collections_{capsule}.json"
+    ndjson_path = log_path.with_suffix(".ndjson")
+    if to_create:
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def record(rec: dict, log):
+        # Append each result as it lands so a crash mid-run keeps what was done
+        api_results.append(rec)
+        log.write(orjson.dumps(rec, default=str) + b"\n" if orjson
+                  else (json.dumps(rec, default=str) + "\n").encode("utf-8"))
+        log.flush()
+
+    # Collection creates are independent; overlap their latency. Results are
+    # reported in sorted order as they come back from map().
+    with ThreadPoolExecutor(max_workers=8) as pool, \
+            (open(ndjson_path, "ab") if to_create else contextlib.nullcontext()) as log:
+        for style_tag, resp, error in pool.map(create, to_create):
+            if error is None:
+                record({"tag": style_tag, "status": "created", "response": resp}, log)
+                print(f"[CREATE] {style_tag} | created successfully")
+            else:
+                print(f"    ❌ FAILED to create '{style_tag}': {error}")
+                record({"tag": style_tag, "status": "failed", "response": {"error": str(error)}}, log)
 
     # --- This is the end of the only loop ---
     # The erroneous second loop has been removed.
 
     # --- Log the results of the API calls ---
+    # The JSON array summary is kept for existing consumers; the .ndjson
+    # alongside it is the incremental, append-only record.
     if api_results or dry_run: # Save log if we did anything
-        log_path = capsule_dir / "outputs/api_jobs" / f"collections_{capsule}.json"
         log_path.parent.mkdir(parents=True, exist_ok=True)
-        
+
         try:
             with open(log_path, "w") as f:
                 json.dump(api_results, f, indent=2)
@@ -20,25 +20,53 @@ Usage:
 """
 
 import argparse
+import functools
 import json
 from pathlib import Path
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def load_json(path: Path) -> dict:
     if not path.exists():
         raise FileNotFoundError(f"Missing file: {path}")
-    return json.loads(path.read_text())
+    raw = path.read_bytes()
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_product_map_cached(path_str: str, mtime: float) -> MappingProxyType:
+    return MappingProxyType(load_json(Path(path_str)))
+
+
+def load_product_map(capsule: str) -> MappingProxyType:
+    """Read-only {cpi: product_gid} map, parsed once per process until the file changes."""
+    path = Path("capsules") / capsule / "manifests" / "product_map.json"
+    if not path.exists():
+        raise FileNotFoundError(f"Missing file: {path}")
+    return _load_product_map_cached(str(path.resolve()), path.stat().st_mtime)
+
+
+def write_json(path: Path, data: dict) -> None:
+    if orjson:
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        path.write_text(json.dumps(data, indent=2))
 
 
 def main(capsule: str) -> None:
-    product_map_path = Path("capsules") / capsule / "manifests" / "product_map.json"
     state_path = Path("capsules") / capsule / "state" / f"product_state_{capsule}.json"
 
-    product_map = load_json(product_map_path)
+    product_map = load_product_map(capsule)
     state = load_json(state_path)
 
     products = state.get("products", {})
     updated = 0
+    dirty = False
     missing = []
 
     for handle, product in products.items():
@@ -52,14 +80,19 @@ def main(capsule: str) -> None:
             continue
 
         # Inject at top level for now (explicit and simple)
-        product["product_gid"] = product_gid
+        if product.get("product_gid") != product_gid:
+            product["product_gid"] = product_gid
+            dirty = True
         updated += 1
 
-    state_path.write_text(json.dumps(state, indent=2))
-
     print(f"[sync_product_gids] Capsule {capsule}")
     print(f"  Injected product_gid for {updated} products")
 
+    if dirty:
+        write_json(state_path, state)
+    else:
+        print("  No changes; state file left untouched.")
+
     if missing:
         print(f"  ⚠️ Missing product_gid for {len(missing)} CPIs:")
         for cpi in sorted(set(missing)):
@@ -2,38 +2,82 @@
 import argparse
 import json
 import os
+import tempfile
+import textwrap
 from datetime import datetime
 
-def load_json_file(path):
-    if os.path.isfile(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
-def save_json_file(path, data):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def mark_resolved(actions, cpi_set, now_iso):
-    for action in actions:
-        if action.get("cpi") in cpi_set:
-            if not action.get("resolved", False):
-                action["resolved"] = True
-                action["resolved_by"] = "metafields_writer"
-                action["resolved_at"] = now_iso
+# metafields_writer result actions that settle a queued CPI
+_RESOLVED_ACTIONS = frozenset({"WROTE", "NOOP_ALREADY_SET"})
+
+def load_json_file(path):
+    """Yields the records of a JSON array file, streamed with ijson when available."""
+    if not os.path.isfile(path):
+        return
+    with open(path, "rb") as f:
+        if ijson is not None:
+            yield from ijson.items(f, "item", use_float=True)
+        else:
+            yield from json.load(f)
+
+def _dumps_record(record) -> bytes:
+    """One record at indent=2, nested one level for the enclosing array."""
+    if orjson is not None:
+        text = orjson.dumps(record, option=orjson.OPT_INDENT_2).decode("utf-8")
+    else:
+        text = json.dumps(record, indent=2, ensure_ascii=False)
+    return textwrap.indent(text, "  ").encode("utf-8")
 
-def deduplicate_actions(actions):
+def save_json_file(path, data):
+    """
+    Writes an iterable of records as an indent=2 JSON array, one record at a
+    time, into a temp file that atomically replaces `path`.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            count = 0
+            f.write(b"[")
+            for record in data:
+                f.write(b",\n" if count else b"\n")
+                f.write(_dumps_record(record))
+                count += 1
+            f.write(b"\n]" if count else b"]")
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def resolve_and_deduplicate(actions, cpi_set, now_iso):
+    """
+    Marks actions for written CPIs as resolved and drops duplicate
+    (cpi, resolved) actions, keeping the first, in a single streaming walk.
+    Yields the surviving actions so queues never have to be held in memory.
+    """
+    cpi_set = frozenset(cpi_set)
     seen = set()
-    deduped = []
+    seen_add = seen.add
     for action in actions:
         cpi = action.get("cpi")
-        resolved = action.get("resolved", False)
-        key = (cpi, resolved)
+        if cpi in cpi_set and not action.get("resolved", False):
+            action["resolved"] = True
+            action["resolved_by"] = "metafields_writer"
+            action["resolved_at"] = now_iso
+        key = (cpi, action.get("resolved", False))
         if key not in seen:
-            seen.add(key)
-            deduped.append(action)
-    return deduped
+            seen_add(key)
+            yield action
 
 def main():
     parser = argparse.ArgumentParser(description="Update action queues from metafields_writer results")
@@ -52,34 +96,28 @@ def main():
     swatch_queue_path = os.path.join(base_path, f"actions_swatch_queue_{capsule}.json")
     manual_review_path = os.path.join(base_path, f"actions_manual_review_{capsule}.json")
 
-    swatch_actions = load_json_file(swatch_queue_path)
-    manual_review_actions = load_json_file(manual_review_path)
-
     # Collect CPIs to mark resolved from results with action WROTE or NOOP_ALREADY_SET
-    cpis_to_resolve = set()
-    for record in results:
-        action = record.get("action")
-        if action in ("WROTE", "NOOP_ALREADY_SET"):
-            cpi = record.get("cpi")
-            if cpi is not None:
-                cpis_to_resolve.add(cpi)
+    cpis_to_resolve = {
+        r["cpi"] for r in results
+        if r.get("action") in _RESOLVED_ACTIONS and r.get("cpi") is not None
+    }
 
     now_iso = datetime.utcnow().isoformat() + "Z"
 
-    # Mark matching swatch actions as resolved
-    mark_resolved(swatch_actions, cpis_to_resolve, now_iso)
-
-    # Deduplicate swatch actions (same cpi + unresolved)
-    swatch_actions = deduplicate_actions(swatch_actions)
-
-    # Deduplicate manual review actions (same cpi + unresolved)
-    manual_review_actions = deduplicate_actions(manual_review_actions)
-
-    # Write back updated queues
-    if swatch_actions or os.path.isfile(swatch_queue_path):
-        save_json_file(swatch_queue_path, swatch_actions)
-    if manual_review_actions or os.path.isfile(manual_review_path):
-        save_json_file(manual_review_path, manual_review_actions)
+    # Queues are streamed: read, updated and written back one record at a time.
+    # A missing queue file is left missing.
+    if os.path.isfile(swatch_queue_path):
+        # Mark matching swatch actions as resolved and deduplicate (same cpi + resolved state)
+        save_json_file(
+            swatch_queue_path,
+            resolve_and_deduplicate(load_json_file(swatch_queue_path), cpis_to_resolve, now_iso),
+        )
+    if os.path.isfile(manual_review_path):
+        # Deduplicate manual review actions (same cpi + resolved state); nothing to resolve
+        save_json_file(
+            manual_review_path,
+            resolve_and_deduplicate(load_json_file(manual_review_path), (), now_iso),
+        )
 
 if __name__ == "__main__":
     main()
@@ -11,9 +11,16 @@ Usage:
 
 import argparse
 import json
+import os
 import pathlib
 import re
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # ---------------------------------------------------------------------
 #  Regex definitions
@@ -25,13 +32,11 @@ CPI_PATTERN = re.compile(
     r"(?:[FS]\d{3}|[A-Z]{2}\d{2})[-_]?(\d{3,5}).*?(\d{6})"
 )
 
-# Accessory patterns: style ranges, fabric prefixes, literal matches.
-ACCESSORY_PATTERNS = [
-    re.compile(r"\b7\d{3}\b"),        # style numbers in 7000 range
-    re.compile(r"\bLLC\d+\b", re.I),  # fabric prefix LLC
-    re.compile(r"\bACC\b", re.I),     # literal ACC marker
-    re.compile(r"ACCESSORY", re.I),   # literal word
-]
+# Accessory patterns, fused into one alternation so each filename is scanned once:
+#   style numbers in 7000 range | fabric prefix LLC | literal ACC marker | literal word
+ACCESSORY_RE = re.compile(
+    r"\b7\d{3}\b|\bLLC\d+\b|\bACC\b|ACCESSORY", re.I
+)
 
 # ---------------------------------------------------------------------
 #  Helper functions
@@ -48,8 +53,23 @@ def extract_cpi(filename: str) -> str | None:
 
 def is_accessory_name(filename: str) -> bool:
     """Return True if filename matches accessory heuristics."""
-    name = filename.upper()
-    return any(p.search(name) for p in ACCESSORY_PATTERNS)
+    return ACCESSORY_RE.search(filename) is not None
+
+
+def list_asset_files(folder: pathlib.Path) -> list[str]:
+    """Sorted names of the regular files in `folder` (empty if it doesn't exist)."""
+    if not folder.exists():
+        return []
+    # scandir reuses readdir's d_type, so is_file() needs no extra stat
+    with os.scandir(folder) as it:
+        return sorted(e.name for e in it if e.is_file())
+
+
+def _dumps_line(row: dict) -> bytes:
+    """One compact JSONL line as bytes (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(row) + b"\n"
+    return (json.dumps(row, separators=(",", ":")) + "\n").encode("utf-8")
 
 
 # ---------------------------------------------------------------------
@@ -62,73 +82,99 @@ def build_manifest(capsule: str, dry_run: bool = False):
     out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / "images_manifest.jsonl"
 
-    manifest = []
-    scanned = 0
+    preview = []  # first rows, shown in dry-run mode
+    total = with_cpi = accessories = 0
     anomalies = []
 
-    for kind in ["ghosts", "editorials", "swatches"]:
-        folder = base / kind
-        if not folder.exists():
-            continue
-
-        for file in sorted(folder.glob("*")):
-            if not file.is_file():
-                continue
-
-            scanned += 1
-            fname = file.name
-
-            accessory = is_accessory_name(fname)
-
-            cpi = extract_cpi(fname)
-            
-            if not cpi:
-                anomalies.append({
-                    "filename": fname,
+    # Bound once: skips the attribute lookups for every scanned file. CPI and
+    # accessory detection stay two searches: accessory markers (e.g. a 7xxx
+    # style number) sit inside the CPI span, so a single alternation would
+    # consume them.
+    _search = CPI_PATTERN.search
+    _accessory_search = ACCESSORY_RE.search
+
+    # One timestamp per run; rows only need second resolution
+    created_at = datetime.datetime.now().isoformat(timespec="seconds")
+
+    kinds = ["ghosts", "editorials", "swatches"]
+    # The three folders are independent; list them concurrently, then
+    # process and write in the fixed kind order below
+    with ThreadPoolExecutor(max_workers=len(kinds)) as pool:
+        listings = list(pool.map(lambda kind: list_asset_files(base / kind), kinds))
+
+    # Rows are written as they are scanned; nothing is held in memory
+    fh = None if dry_run else open(out_path, "wb", buffering=1 << 20)
+    batch = []  # encoded lines, written 1000 at a time
+    _append = batch.append
+    _dumps = _dumps_line
+    _write = fh.write if fh is not None else None
+    try:
+        for kind, names in zip(kinds, listings):
+            source_dir = str(base / kind)
+
+            for fname in names:
+
+                accessory = _accessory_search(fname) is not None
+
+                m = _search(fname)
+                cpi = f"{m[1]}-{m[2]}" if m else None
+
+                if not cpi:
+                    anomalies.append({
+                        "filename": fname,
+                        "asset_type": kind,
+                        "reason": "CPI not detected",
+                        "is_accessory": accessory
+                    })
+
+                row = {
+                    "capsule": capsule,
+                    "cpi": cpi,
                     "asset_type": kind,
-                    "reason": "CPI not detected",
-                    "is_accessory": accessory
-                })
-
-
-            manifest.append({
-                "capsule": capsule,
-                "cpi": cpi,
-                "asset_type": kind,
-                "filename": fname,
-                "source_dir": str(file.parent),
-                "is_accessory": accessory,
-                "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
-            })
+                    "filename": fname,
+                    "source_dir": source_dir,
+                    "is_accessory": accessory,
+                    "created_at": created_at,
+                }
+
+                total += 1
+                with_cpi += cpi is not None
+                accessories += accessory
+
+                if fh is not None:
+                    _append(_dumps(row))
+                    if len(batch) >= 1000:
+                        _write(b"".join(batch))
+                        batch.clear()
+                elif len(preview) < 5:
+                    preview.append(row)
+        if fh is not None and batch:
+            _write(b"".join(batch))
+    finally:
+        if fh is not None:
+            fh.close()
 
     # Diagnostics
-    total = len(manifest)
-    with_cpi = sum(1 for r in manifest if r["cpi"])
     without_cpi = total - with_cpi
-    accessories = sum(1 for r in manifest if r["is_accessory"])
 
     if dry_run:
-        print(json.dumps(manifest[:5], indent=2))
+        print(json.dumps(preview, indent=2))
         print(f"\n🧩 {total} assets scanned | "
               f"{with_cpi} CPIs matched | "
               f"{without_cpi} missing | "
               f"{accessories} accessories tagged.")
         return
 
-    with open(out_path, "w", encoding="utf-8") as fh:
-        for row in manifest:
-            fh.write(json.dumps(row) + "\n")
-
     print(f"✅ {total} assets indexed for {capsule} → {out_path}")
     print(f"📊 Summary: {with_cpi} CPIs matched | {without_cpi} missing | "
           f"{accessories} accessories tagged.")
-    if scanned == 0:
+    if total == 0:
         print("⚠️  No files found; check asset folder paths.")
     if anomalies:
         anomaly_path = out_dir / "anomalies.jsonl"
-        with open(anomaly_path, "w", encoding="utf-8") as f:
+        with open(anomaly_path, "wb") as f:
             for a in anomalies:
-                f.write(json.dumps(a) + "\n")
+                f.write(_dumps_line(a))
         print(f"⚠️  {len(anomalies)} anomalies logged → {anomaly_path}")
 
 # ---------------------------------------------------------------------
@@ -12,29 +12,17 @@ sys.path.append(str(project_root))
 
 from api.shopify_client import ShopifyClient
 
-# Re-use the robust regex and helper functions from our enrichment script
-CPI_PATTERN_FROM_PRODUCT_ID = re.compile(r"(\d{3,5})\s+[A-Z0-9]+\s+(\d{6})")
+# Re-use the robust regex from our enrichment script
+_CPI_RX = re.compile(r"(\d{3,5})\s+[A-Z0-9]+\s+(\d{6})")
 
-def extract_product_id_from_tags(tags: list) -> str | None:
-    """Extracts the full Product ID from a list of Shopify tags."""
+def _cpi_from_tags(tags: list) -> str | None:
+    """Returns the CPI (e.g., '1008-000182') from the first tag matching the Product ID pattern."""
     if not isinstance(tags, list):
         return None
-    for tag in tags:
-        tag = tag.strip()
-        # A Product ID tag reliably has multiple space-separated parts.
-        if tag.count(' ') >= 2:
-            return tag
-    return None
-
-def extract_cpi_from_product_id(product_id: str) -> str | None:
-    """Converts a full Product ID into a CPI (e.g., '1008-000182')."""
-    if not product_id:
-        return None
-    match = CPI_PATTERN_FROM_PRODUCT_ID.search(product_id)
-    if match:
-        style, color = match.groups()
-        return f"{style}-{color}"
-    return None
+    # No character class in _CPI_RX matches ',', so a match can't straddle two
+    # tags; one search over the joined string finds the first matching tag.
+    m = _CPI_RX.search(",".join(tags))
+    return f"{m[1]}-{m[2]}" if m else None
 
 def main(capsule: str, dry_run: bool = False):
     """
@@ -42,27 +30,24 @@ def main(capsule: str, dry_run: bool = False):
     for products with a specific tag.
     """
     client = ShopifyClient()
-    product_map = {}
     
     # The capsule code (e.g., "S126") is used as the tag to query.
     tag_to_query = capsule
     
-    # Fetch all products from Shopify with the specified tag
-    products = client.get_products_by_tag(tag_to_query)
+    # Stream products page by page from Shopify; later products win on CPI collisions
+    print(f"Fetching all products tagged with '{tag_to_query}' from Shopify...")
+    product_map = {}
+    product_count = 0
+    for product in client.get_products_by_tag_iter(tag_to_query):
+        product_count += 1
+        if (gid := product.get("id")) and (cpi := _cpi_from_tags(product.get('tags', []))):
+            product_map[cpi] = gid
+    print(f"Found {product_count} products with the tag.")
 
-    if not products:
+    if not product_count:
         print(f"⚠️  Warning: No products found in Shopify with the tag '{tag_to_query}'. Cannot build map.")
         return
 
-    for product in products:
-        full_product_id = extract_product_id_from_tags(product.get('tags', []))
-        cpi = extract_cpi_from_product_id(full_product_id)
-        
-        gid = product.get("id")
-
-        if cpi and gid:
-            product_map[cpi] = gid
-
     if dry_run:
         print("\n[dry-run] --- Product Map Preview ---")
         # Show a sample of the map that would be created
@@ -4,6 +4,21 @@ import pathlib
 from datetime import datetime # Import datetime
 import re # Import re for timestamp check
 
+def _read_import_csv(path: str, **kwargs) -> pd.DataFrame:
+    """
+    Reads a Shopify import CSV with Handle as string and Image Position parsed
+    straight into nullable Int64. Files whose positions aren't clean integers
+    are re-read and coerced once (invalid values become <NA>).
+    """
+    dtype = {'Handle': 'string'}
+    try:
+        return pd.read_csv(path, low_memory=False, dtype={**dtype, 'Image Position': 'Int64'}, **kwargs)
+    except (ValueError, TypeError):
+        df = pd.read_csv(path, low_memory=False, dtype=dtype, **kwargs)
+        if 'Image Position' in df.columns:
+            df['Image Position'] = pd.to_numeric(df['Image Position'], errors='coerce').astype('Int64')
+        return df
+
 def combine_csvs(ready_file_path: str, missing_file_path: str, output_file_path: str):
     """
     Combines the 'ready' Shopify import CSV with the 'missing images' CSV.
@@ -14,9 +29,11 @@ def combine_csvs(ready_file_path: str, missing_file_path: str, output_file_path:
         output_file_path: Path where the combined CSV should be saved.
     """
     print(f"Loading 'ready' file: {ready_file_path}")
+
     try:
         # Explicitly set low_memory=False if there are mixed type warnings during load
-        df_ready = pd.read_csv(ready_file_path, low_memory=False)
+        # Handle and Image Position are typed at read time instead of cast after the fact
+        df_ready = _read_import_csv(ready_file_path)
         print(f"  > Loaded {len(df_ready)} rows.")
     except FileNotFoundError:
         print(f"❌ Error: File not found at {ready_file_path}")
@@ -27,13 +44,11 @@ def combine_csvs(ready_file_path: str, missing_file_path: str, output_file_path:
 
     print(f"Loading 'missing images' file: {missing_file_path}")
     try:
-        df_missing = pd.read_csv(missing_file_path, low_memory=False)
-        print(f"  > Loaded {len(df_missing)} rows.")
-        # Select only necessary columns to avoid type conflicts
+        # Parse only the necessary columns (avoids type conflicts and skips the rest);
+        # the callable tolerates files where some of them are absent
         cols_to_keep = ['Handle', 'Image Src', 'Image Position']
-        # Keep only columns that actually exist in df_missing
-        cols_present = [col for col in cols_to_keep if col in df_missing.columns]
-        df_missing = df_missing[cols_present]
+        df_missing = _read_import_csv(missing_file_path, usecols=lambda col: col in cols_to_keep)
+        print(f"  > Loaded {len(df_missing)} rows.")
 
     except FileNotFoundError:
         print(f"ℹ️ Info: File not found at {missing_file_path}. Skipping combination.")
@@ -45,9 +60,6 @@ def combine_csvs(ready_file_path: str, missing_file_path: str, output_file_path:
     # Combine the DataFrames
     if not df_missing.empty:
         print(f"Combining {len(df_ready)} and {len(df_missing)} rows...")
-        # Ensure 'Handle' is string in both before concat
-        df_ready['Handle'] = df_ready['Handle'].astype(str)
-        df_missing['Handle'] = df_missing['Handle'].astype(str)
         df_combined = pd.concat([df_ready, df_missing], ignore_index=True)
         print(f"  > Combined DataFrame has {len(df_combined)} rows.")
     else:
@@ -55,26 +67,13 @@ def combine_csvs(ready_file_path: str, missing_file_path: str, output_file_path:
         df_combined = df_ready.copy() # Use a copy
 
     # --- CRITICAL STEP: Sort by Handle, then by Image Position ---
-    # Ensure Handle is string before sorting
-    df_combined['Handle'] = df_combined['Handle'].astype(str)
-    # Convert Image Position to numeric, coercing errors to NaN
-    df_combined['Image Position'] = pd.to_numeric(df_combined['Image Position'], errors='coerce')
-
     print("Sorting combined data by Handle and Image Position...")
     # Sort, placing NaN positions last
-    df_combined.sort_values(by=['Handle', 'Image Position'], inplace=True, na_position='last')
+    df_combined.sort_values(by=['Handle', 'Image Position'], inplace=True, na_position='last', kind='stable')
 
     # Reset index after sorting if desired (optional)
     # df_combined.reset_index(drop=True, inplace=True)
 
-    # Ensure Image Position is Integer (using nullable Int64) after sorting
-    # Handle potential All-NA slice warning if converting a column full of NaNs
-    if pd.api.types.is_numeric_dtype(df_combined['Image Position']):
-         df_combined['Image Position'] = df_combined['Image Position'].astype('Int64')
-    else:
-         # If it became object due to mix types or errors, try coercing again
-         df_combined['Image Position'] = pd.to_numeric(df_combined['Image Position'], errors='coerce').astype('Int64')
-
 
     # Save the combined and sorted DataFrame
     try:
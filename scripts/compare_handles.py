@@ -1,6 +1,19 @@
 import pandas as pd
 import argparse
 import pathlib
+import sys
+
+# Project root on the path so the shared 'utils' package resolves when run as a script
+project_root = pathlib.Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.csv_options import STRING_DTYPE
+
+
+def load_handle_set(csv_path: str) -> set:
+    """Stripped, non-null handles from the CSV's Handle column (the only column parsed)."""
+    handles = pd.read_csv(csv_path, usecols=['Handle'], dtype={'Handle': STRING_DTYPE})['Handle']
+    return set(handles.str.strip().dropna())
 
 def find_missing_handles(enriched_file_path: str, ready_file_path: str):
     """
@@ -13,10 +26,7 @@ def find_missing_handles(enriched_file_path: str, ready_file_path: str):
     """
     print(f"Loading enriched file: {enriched_file_path}")
     try:
-        df_enriched = pd.read_csv(enriched_file_path)
-        # Ensure Handle column is string and stripped
-        df_enriched['Handle'] = df_enriched['Handle'].astype(str).str.strip()
-        handles_enriched = set(df_enriched['Handle'].unique())
+        handles_enriched = load_handle_set(enriched_file_path)
         print(f"  > Found {len(handles_enriched)} unique handles.")
     except FileNotFoundError:
         print(f"❌ Error: File not found at {enriched_file_path}")
@@ -27,10 +37,7 @@ def find_missing_handles(enriched_file_path: str, ready_file_path: str):
 
     print(f"Loading ready file: {ready_file_path}")
     try:
-        df_ready = pd.read_csv(ready_file_path)
-        # Ensure Handle column is string and stripped
-        df_ready['Handle'] = df_ready['Handle'].astype(str).str.strip()
-        handles_ready = set(df_ready['Handle'].unique())
+        handles_ready = load_handle_set(ready_file_path)
         print(f"  > Found {len(handles_ready)} unique handles.")
     except FileNotFoundError:
         print(f"❌ Error: File not found at {ready_file_path}")
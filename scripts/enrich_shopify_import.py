@@ -1,44 +1,67 @@
 import pandas as pd
+import numpy as np
 import re
 import json
 import pathlib
 import argparse
 from datetime import datetime
 from collections import Counter
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import sys
 import math # For checking NaN
 
+# Project root on the path so the shared 'utils' package resolves when run as a script
+project_root = pathlib.Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.csv_options import STRING_DTYPE
+from utils.tracker_csv import find_header_row
+from utils.product_tags import extract_product_ids_from_tags, extract_cpis_from_tags, split_category_tags
+
 CPI_PATTERN_FROM_PRODUCT_ID = re.compile(
     r"(?:[FS]\d{3}|[A-Z]{2}\d{2})[-_]?(\d{3,5}).*?(\d{6})"
 )
 
+# Export column the fabric / textile content bullets are written to
+DETAILS_COL = 'Details (product.metafields.altuzarra.details)'
+
+# Model shot number, used as the sort key for RTW editorials
+MODEL_IMAGE_PATTERN = re.compile(r"model_image_(\d+)")
+# Atomic percentage-material pairs (e.g. "68% Cotton"), up to the next percent or end of string
+FABRIC_PAIR_PATTERN = re.compile(r'(\d+\s*%\s*[A-Za-z][A-Za-z\s\-]*)(?=\s*\d+\s*%|$)')
+
 # --- Filename Processing Logic (UPDATED for Accessories) ---
+# Define common suffixes more precisely, including accessory types
+_FILENAME_SUFFIXES = [
+    # General RTW/Common
+    r"_ghost(?:_\d+)?",
+    r"_model_image(?:_\d+)?(?:_\d+)?",
+    r"_hero_image(?:__\d+)?",
+    r"_swatch",
+    # Specific Accessory Types (often marked as 'ghosts' in manifest)
+    # Added complexity to handle potential numbers and '_main' suffix
+    r"_ghost_front(?:_\d+)?(?:_main)?",
+    r"_ghost_detail(?:_\d+)?(?:_main)?",
+    r"_ghost_side(?:_\d+)?(?:_main)?",
+    r"_ghost_aerial(?:_\d+)?(?:_main)?",
+    r"_Detail" # Handle filenames ending directly with _Detail.jpg
+]
+# Optional _FINAL (case-insensitive), then a known suffix, then .jpg at the END.
+# Group 1 is the part BEFORE this pattern. Compiled once at import.
+_SUFFIX_RE = re.compile(
+    rf"^(.*?)(?i:_FINAL)?({'|'.join(dict.fromkeys(_FILENAME_SUFFIXES))})\.jpg$"
+)
+_FINAL_RE = re.compile(r"_FINAL\.jpg$", re.IGNORECASE)
+
+# Pure function of the filename; the same names recur across handles and runs
+@functools.lru_cache(maxsize=16384)
 def get_base_filename(filename: str) -> str:
     """Removes standard suffixes including specific accessory types."""
     if not filename or not isinstance(filename, str): return ""
 
-    # Define common suffixes more precisely, including accessory types
-    suffixes = [
-        # General RTW/Common
-        r"_ghost(?:_\d+)?",
-        r"_model_image(?:_\d+)?(?:_\d+)?",
-        r"_hero_image(?:__\d+)?",
-        r"_swatch",
-        # Specific Accessory Types (often marked as 'ghosts' in manifest)
-        # Added complexity to handle potential numbers and '_main' suffix
-        r"_ghost_front(?:_\d+)?(?:_main)?",
-        r"_ghost_detail(?:_\d+)?(?:_main)?",
-        r"_ghost_side(?:_\d+)?(?:_main)?",
-        r"_ghost_aerial(?:_\d+)?(?:_main)?",
-        r"_Detail" # Handle filenames ending directly with _Detail.jpg
-    ]
-    # Remove duplicates just in case
-    suffixes = list(dict.fromkeys(suffixes))
-    suffix_pattern = "|".join(suffixes)
-
-    # Regex: Look for optional _FINAL, then a known suffix, then .jpg at the END.
-    # Capture the part BEFORE this pattern.
-    # Added (?i) for case-insensitivity within the pattern itself
-    match = re.match(rf"^(.*?)(?i:_FINAL)?({suffix_pattern})\.jpg$", filename)
+    match = _SUFFIX_RE.match(filename)
 
     if match:
         base = match.group(1) # Part before optional _FINAL and suffix
@@ -48,8 +71,7 @@ def get_base_filename(filename: str) -> str:
         return base.strip()
     else:
         # If no known suffix found, maybe it's just name.jpg or name_FINAL.jpg
-        # Use re.sub for case-insensitivity here too
-        base = re.sub(r"_FINAL\.jpg$", ".jpg", filename, flags=re.IGNORECASE)
+        base = _FINAL_RE.sub(".jpg", filename)
         # Return name without extension, stripped
         return base.rsplit('.', 1)[0].strip() if '.' in base else base.strip()
 
@@ -62,10 +84,13 @@ def check_filename_consistency(filenames: list) -> tuple[bool, str | None, list]
     base_names = [get_base_filename(f) for f in valid_filenames]
     if not base_names: return True, None, [] # Should not happen if valid_filenames exist
 
+    # Common case: every name shares one base, no counting needed
+    unique_bases = set(base_names)
+    if len(unique_bases) == 1: return True, next(iter(unique_bases)), []
+
     pattern_counter = Counter(base_names)
-    # Get the most frequent base name. Handle ties by sorting alphabetically.
-    most_common_items = pattern_counter.most_common()
-    most_common_pattern = sorted(most_common_items, key=lambda x: (-x[1], x[0]))[0][0]
+    # Get the most frequent base name. Handle ties by taking the alphabetically first.
+    most_common_pattern = min(pattern_counter.items(), key=lambda x: (-x[1], x[0]))[0]
 
     # Find filenames whose base does not match the most common one
     inconsistent_filenames_data = [
@@ -92,6 +117,8 @@ CATEGORY_TAGS_MAP = {
     86: "collection_ready-to-wear, collection_knitwear, collection_pants", 88: "collection_ready-to-wear, collection_knitwear, collection_tops"
 }
 
+CATEGORY_TAGS = split_category_tags(CATEGORY_TAGS_MAP)
+
 def extract_product_id_from_tags(tags_str: str) -> str | None:
     """Finds the tag that represents the full Product ID."""
     if not isinstance(tags_str, str): return None
@@ -125,12 +152,12 @@ def build_tags(source_record, existing_tags_str):
     if pd.notna(source_record.get('Description')): new_tags.append(f"style_{source_record['Description'].title()}")
     if pd.notna(source_record.get('SEASON CODE')): new_tags.append(str(source_record['SEASON CODE']).replace('S1', 'SS'))
     if pd.notna(source_record.get('Colour')): new_tags.append(f"color_{' '.join(str(source_record['Colour']).split(' ')[1:]).lower()}")
-    if category_code_to_use and category_code_to_use in CATEGORY_TAGS_MAP:
-        new_tags.extend([t.strip() for t in CATEGORY_TAGS_MAP[category_code_to_use].split(',')])
+    if category_code_to_use and category_code_to_use in CATEGORY_TAGS:
+        new_tags.extend(CATEGORY_TAGS[category_code_to_use])
 
-    existing_tags = [t.strip() for t in str(existing_tags_str).split(',') if t.strip()] # Added str()
+    existing_tags = (t.strip() for t in str(existing_tags_str).split(',')) # Added str()
     # Use dict.fromkeys for unique preserving order, filter ensures no empty strings
-    return ', '.join(filter(None, list(dict.fromkeys(existing_tags + new_tags))))
+    return ', '.join(filter(None, dict.fromkeys(chain(existing_tags, new_tags))))
 # --- END Tag Generation ---
 
 
@@ -142,10 +169,7 @@ def sort_images(images, is_accessory):
     Accessory Order: ghost_front (0), ghost_detail/_Detail (1), ghost_side (2),
                      ghost_aerial (3), other ghosts (4), editorials (5).
     """
-    def sort_key(img_record):
-        filename = img_record.get('filename', '').lower() # Use lower case for comparisons
-        asset_type = img_record.get('asset_type', '')
-
+    def sort_key(filename, asset_type):
         if is_accessory:
             # Accessory specific sorting priorities
             if 'ghost_front' in filename: return (0, filename)
@@ -159,22 +183,65 @@ def sort_images(images, is_accessory):
             # RTW Sorting Order: Ghost -> Hero -> Model # -> Other
             if asset_type == 'ghosts': return (0, filename) # Ghost is priority 0
             if 'hero_image' in filename: return (1, filename) # Hero is priority 1
-            model_match = re.search(r'model_image_(\d+)', filename)
+            model_match = MODEL_IMAGE_PATTERN.search(filename)
             if model_match:
                 try: return (2, int(model_match.group(1)), filename) # Model by number
                 except ValueError: return (3, filename) # Fallback if number isn't int
             return (3, filename) # Other editorials are priority 3
 
-    # Filter out swatches BEFORE sorting
-    images_to_sort = [
-        img for img in images
-        if img.get('filename') and img.get('asset_type') != 'swatches'
-    ]
-
-    return sorted(images_to_sort, key=sort_key)
+    # Decorate in the same pass that filters out swatches, sort the
+    # (key, position, record) tuples, then undecorate. The position keeps
+    # the sort stable and ensures records are never compared.
+    decorated = []
+    for position, img in enumerate(images):
+        filename = img.get('filename')
+        asset_type = img.get('asset_type', '')
+        if not filename or asset_type == 'swatches':
+            continue
+        decorated.append((sort_key(filename.lower(), asset_type), position, img)) # Use lower case for comparisons
+    decorated.sort()
+    return [img for _, _, img in decorated]
 # --- END Image Sorting ---
 
 
+# --- Input Loading (memoized per path + mtime) ---
+@functools.lru_cache(maxsize=8)
+def _read_tracker_cached(path_str: str, mtime: float) -> pd.DataFrame:
+    # Every tracker cell is text (keep_default_na=False), so the whole sheet reads as strings
+    tracker_df_raw = pd.read_csv(path_str, header=None, encoding='cp1252', keep_default_na=False, dtype=STRING_DTYPE)
+    header_row_index = find_header_row(tracker_df_raw)
+    tracker_df = tracker_df_raw.copy()
+    tracker_df.columns = tracker_df.iloc[header_row_index]
+    tracker_df = tracker_df.drop(tracker_df.index[:header_row_index + 1]).reset_index(drop=True)
+    tracker_df.columns = tracker_df.columns.str.strip()
+    return tracker_df
+
+# Free-text export columns the enrichment works on with .str ops / isinstance
+# checks; read as strings instead of boxed objects. Every column is still
+# loaded: the export is written back out whole as the Shopify import.
+_EXPORT_TEXT_DTYPES = {col: STRING_DTYPE for col in ('Title', 'Tags', 'Body (HTML)')}
+
+@functools.lru_cache(maxsize=8)
+def _read_export_cached(path_str: str, mtime: float) -> pd.DataFrame:
+    return pd.read_csv(path_str, dtype=_EXPORT_TEXT_DTYPES, engine='c')
+
+@functools.lru_cache(maxsize=8)
+def _read_manifest_cached(path_str: str, mtime: float) -> pd.DataFrame:
+    # pandas' line-delimited JSON reader; values are kept as written (no dtype/date inference)
+    manifest_df = pd.read_json(path_str, lines=True, dtype=False, convert_dates=False)
+    # Few distinct values repeated across many rows: categoricals make the
+    # per-CPI `==` filters integer-code compares and shrink the frame
+    for col in ('cpi', 'asset_type'):
+        if col in manifest_df.columns:
+            manifest_df[col] = manifest_df[col].astype('category')
+    return manifest_df
+
+def _load_cached(reader, path: pathlib.Path) -> pd.DataFrame:
+    """Parsed input from `reader`, re-read only when the file changes. Returns a copy the caller may mutate."""
+    return reader(str(path.resolve()), path.stat().st_mtime).copy()
+# --- END Input Loading ---
+
+
 # --- Main Execution ---
 def main(capsule: str, dry_run: bool, override_file: str = None):
     CDN_PREFIX = 'https://cdn.shopify.com/s/files/1/0148/9561/2004/files/'
@@ -192,31 +259,21 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
         output_dir.mkdir(parents=True, exist_ok=True)
 
         tracker_path = capsule_dir / "inputs/S226 Shopify upload masterfile.csv"
-        tracker_df_raw = pd.read_csv(tracker_path, header=None, encoding='cp1252', keep_default_na=False)
-        header_row_index = tracker_df_raw[tracker_df_raw.apply(lambda r: r.astype(str).str.contains('Product ID').any(), axis=1)].index[0]
-        tracker_df = tracker_df_raw.copy()
-        tracker_df.columns = tracker_df.iloc[header_row_index]
-        tracker_df = tracker_df.drop(tracker_df.index[:header_row_index + 1]).reset_index(drop=True)
-        tracker_df.columns = tracker_df.columns.str.strip()
+        tracker_df = _load_cached(_read_tracker_cached, tracker_path)
 
         if 'RRP (USD)' in tracker_df.columns:
             print("ℹ️ Tracker contains RRP (USD) but pricing is ignored in favor of Shopify export.")
 
-        export_df = pd.read_csv(capsule_dir / "inputs/products_export_1.csv")
+        export_df = _load_cached(_read_export_cached, capsule_dir / "inputs/products_export_1.csv")
 
         # --- HARD-SKIP WS BUY PRODUCTS EARLY ---
         # Identify parent rows: Title not null/empty, Tags contains 'WS Buy' (case-insensitive, exact match)
         parent_mask = export_df['Title'].notna() & (export_df['Title'].astype(str).str.strip() != '')
-        # Split tags, check for 'WS Buy' tag (case-insensitive, ignore whitespace)
-        def has_ws_buy(tags):
-            if not isinstance(tags, str):
-                return False
-            return any(
-                t.strip().lower() == 'ws buy'
-                for t in tags.split(',')
-            )
+        # Check for a 'WS Buy' tag (case-insensitive, ignore whitespace) as one
+        # vectorized match over the Tags column rather than a per-row apply
+        has_ws_buy = export_df['Tags'].str.contains(r'(?:^|,)\s*ws buy\s*(?:,|$)', case=False, regex=True, na=False)
         ws_buy_parent_handles = set(
-            export_df[parent_mask & export_df['Tags'].apply(has_ws_buy)]['Handle']
+            export_df[parent_mask & has_ws_buy]['Handle']
         )
         n_handles = len(ws_buy_parent_handles)
         if n_handles > 0:
@@ -227,8 +284,7 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
             n_rows_removed = before_rows - after_rows
             print(f"> INFO: Skipped {n_handles} WS Buy handles ({n_rows_removed} rows removed).")
         manifest_path = capsule_dir / "manifests/images_manifest.jsonl"
-        manifest_recs = [json.loads(line) for line in manifest_path.read_text().splitlines() if line.strip()]
-        manifest_df = pd.DataFrame(manifest_recs)
+        manifest_df = _load_cached(_read_manifest_cached, manifest_path)
         print("✅ Successfully loaded all source files.")
     except (FileNotFoundError, IndexError) as e:
         print(f"❌ Error loading or parsing files: {e}")
@@ -280,26 +336,65 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
              print(f"  > INFO: Override file '{override_file}' not found. No overrides applied.")
     # --- END OVERRIDE LOADING ---
 
-    handle_to_cpi_map = {
-        str(row['Handle']).strip(): cpi # Ensure handles are stripped strings
-        for _, row in export_df[export_df['Title'].notna()].iterrows()
-        if pd.notna(row.get('Handle')) and (cpi := extract_cpi_from_product_id(extract_product_id_from_tags(row['Tags'])))
-    }
+    # Product ID tag of every parent row, extracted in one pass; the handle
+    # loop below looks its parent row up here
+    product_id_by_row = extract_product_ids_from_tags(export_df.loc[export_df['Title'].notna(), 'Tags'], CPI_PATTERN_FROM_PRODUCT_ID).dropna().to_dict()
+
+    parent_rows = export_df[export_df['Title'].notna() & export_df['Handle'].notna()]
+    parent_cpis = extract_cpis_from_tags(parent_rows['Tags'], CPI_PATTERN_FROM_PRODUCT_ID)
+    has_cpi = parent_cpis.notna()
+    handle_to_cpi_map = dict(zip(
+        parent_rows['Handle'][has_cpi].astype(str).str.strip(), # Ensure handles are stripped strings
+        parent_cpis[has_cpi],
+    ))
     print(f"✅ Built Handle-to-CPI map for {len(handle_to_cpi_map)} products.")
 
     # Ensure Product ID in tracker is string for lookup
     tracker_df['Product ID'] = tracker_df['Product ID'].astype(str).str.strip()
     tracker_df.set_index('Product ID', inplace=True)
+    # Plain dict record per Product ID (first row wins on duplicates): each
+    # handle's lookup is then a dict get rather than a .loc building a Series
+    tracker_unique = tracker_df[~tracker_df.index.duplicated(keep='first')]
+    tracker_records = dict(zip(tracker_unique.index, tracker_unique.to_dict('records')))
     # tracker_df['RRP (USD)'] = pd.to_numeric(tracker_df['RRP (USD)'], errors='coerce')
 
+    # Manifest records per CPI (in manifest order), built in one pass; each
+    # handle's image lookup is then a dict get. The records are shared between
+    # handles with the same CPI and are only read, never mutated.
+    images_by_cpi = {}
+    if 'cpi' in manifest_df.columns:
+        for rec in manifest_df.to_dict('records'):
+            if pd.notna(rec['cpi']):
+                images_by_cpi.setdefault(rec['cpi'], []).append(rec)
+
     # --- Initialize list for new rows ---
     all_new_rows_to_add = []
-    missing_image_rows = [] # For the separate CSV file
+    # Extra images with no row to land on, for the separate CSV file:
+    # (parent row position, Image Src, Image Position) per image
+    missing_image_rows = []
+
+    # Per-column {row index: value} updates, collected in the loop and applied
+    # to export_df in one .loc assignment per column afterwards
+    tag_updates = {}
+    body_updates = {}
+    details_updates = {}
+    image_src_updates = {}
+    image_pos_updates = {}
 
     # Ensure Handle in export_df is stripped string before grouping
     export_df['Handle'] = export_df['Handle'].astype(str).str.strip()
 
-    for handle, product_group in export_df.groupby('Handle'):
+    # Row positions per handle, built once; each handle then works on numpy
+    # slices of these arrays instead of a materialized sub-DataFrame
+    rows_by_handle = export_df.groupby('Handle').indices
+    row_labels = export_df.index.to_numpy()
+    is_parent_row = (export_df['Title'].notna() & (export_df['Title'] != '')).to_numpy(dtype=bool)
+    tags_values = export_df['Tags'].to_numpy()
+    body_values = export_df['Body (HTML)'].to_numpy() if 'Body (HTML)' in export_df.columns else None
+
+    for handle in sorted(rows_by_handle):
+        positions = rows_by_handle[handle]
+        group_indices = row_labels[positions]
         # Skip processing if handle couldn't be mapped (e.g., missing Product ID tag initially)
         if handle not in handle_to_cpi_map:
             print(f"  > WARNING: Skipping handle '{handle}' as it could not be mapped to a CPI (check parent row tags).")
@@ -308,16 +403,17 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
             continue
         cpi = handle_to_cpi_map[handle]
 
-        parent_row_filter = product_group['Title'].notna() & (product_group['Title'] != '')
+        parent_row_filter = is_parent_row[positions]
         # Handle cases where a group might somehow lack a parent row
-        parent_row_indices = product_group[parent_row_filter].index
-        if parent_row_indices.empty:
+        parent_positions = positions[parent_row_filter]
+        if parent_positions.size == 0:
              print(f"  > ANOMALY: No parent row (with Title) found for handle '{handle}'. Skipping.")
              anomalous_handles.add(handle)
              anomaly_details_log.append({"Handle": handle, "CPI": cpi, "Reason": "Missing Parent Row"})
              continue
-        parent_row_index = parent_row_indices[0] # Take the first if multiple somehow exist
-        full_product_id = extract_product_id_from_tags(product_group.loc[parent_row_index, 'Tags'])
+        parent_position = parent_positions[0] # Take the first if multiple somehow exist
+        parent_row_index = row_labels[parent_position]
+        full_product_id = product_id_by_row.get(parent_row_index)
 
         # Enrich data from Tracker
         try:
@@ -326,25 +422,23 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
             if not full_product_id_clean:
                  raise KeyError("Product ID tag missing or invalid.") # Treat as lookup failure
 
-            source_record = tracker_df.loc[full_product_id_clean]
-            new_tags = build_tags(source_record, product_group.loc[parent_row_index, 'Tags'])
-            export_df.loc[parent_row_index, 'Tags'] = new_tags
+            source_record = tracker_records[full_product_id_clean]
+            new_tags = build_tags(source_record, tags_values[parent_position])
+            tag_updates[parent_row_index] = new_tags
 
-            child_indices = product_group[~parent_row_filter].index
-            export_df.loc[child_indices, 'Tags'] = '' # Clear tags on child rows
+            child_indices = group_indices[~parent_row_filter]
+            tag_updates.update(dict.fromkeys(child_indices, '')) # Clear tags on child rows
 
             # --- Product Description → Body (HTML) enrichment ---
             # Only write if Body (HTML) is empty/blank, and Product Description exists in masterfile
-            body_html_val = export_df.loc[parent_row_index, 'Body (HTML)'] if 'Body (HTML)' in export_df.columns else ''
+            body_html_val = body_values[parent_position] if body_values is not None else ''
             if (not isinstance(body_html_val, str) or body_html_val.strip() == ''):
                 prod_desc = source_record.get('Product Description', '')
                 if isinstance(prod_desc, str) and prod_desc.strip():
-                    export_df.loc[parent_row_index, 'Body (HTML)'] = prod_desc
+                    body_updates[parent_row_index] = prod_desc
             # --- END Body (HTML) enrichment ---
 
             # --- Fabric / Textile Content → Details metafield enrichment ---
-            details_col = 'Details (product.metafields.altuzarra.details)'
-
             fabric_raw = source_record.get('Fabric Content')
             textile_raw = source_record.get('Textile Content')
             product_details_raw = source_record.get('Product Details')
@@ -361,10 +455,7 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
             if source_text:
                 # Use a stricter, non-greedy regex to extract atomic percentage-material pairs (e.g. "68% Cotton")
                 # This ensures we do not truncate material names and capture up to the next percent or end of string.
-                pairs = re.findall(
-                    r'(\d+\s*%\s*[A-Za-z][A-Za-z\s\-]*)(?=\s*\d+\s*%|$)',
-                    source_text
-                )
+                pairs = FABRIC_PAIR_PATTERN.findall(source_text)
 
                 bullet_lines = []
                 for pair in pairs:
@@ -373,10 +464,10 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
                         bullet_lines.append(f"- {cleaned}")
 
                 if bullet_lines:
-                    export_df.loc[parent_row_index, details_col] = "\n".join(bullet_lines)
+                    details_updates[parent_row_index] = "\n".join(bullet_lines)
             # --- END Fabric / Textile Content enrichment ---
             # Apply price to ALL rows in the group
-            # export_df.loc[product_group.index, 'Variant Price'] = source_record['RRP (USD)']
+            # export_df.loc[group_indices, 'Variant Price'] = source_record['RRP (USD)']
 
         except KeyError: # Catch lookup failure (Product ID not in tracker or missing tag)
             reason = "Product ID Not Found in Tracker"
@@ -387,10 +478,12 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
             # DO NOT continue here, let it proceed to check images if they exist
 
         # --- Image Processing ---
-        images_for_cpi = manifest_df[manifest_df['cpi'] == cpi].to_dict('records')
+        images_for_cpi = images_by_cpi.get(cpi, [])
         final_image_list = [] # Reset for each product
         override_insert_info = None # Reset for each product
         has_any_images = bool(images_for_cpi)
+        # Lower-cased once per CPI and shared by the filename checks below
+        filenames_lower = [img.get('filename', '').lower() for img in images_for_cpi]
 
         # Determine is_accessory status early
         # Handle cases where images_for_cpi might be empty AFTER filtering anomalies
@@ -410,7 +503,7 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
         has_primary_ghost = False
         if images_for_cpi:
             if is_accessory:
-                has_primary_ghost = any('ghost_front' in img.get('filename','').lower() for img in images_for_cpi if img.get('asset_type') == 'ghosts')
+                has_primary_ghost = any('ghost_front' in name for img, name in zip(images_for_cpi, filenames_lower) if img.get('asset_type') == 'ghosts')
             else: # RTW
                 has_primary_ghost = any(img.get('asset_type') == 'ghosts' for img in images_for_cpi)
 
@@ -448,9 +541,13 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
                     # IMAGE_SOFT_FAIL: allow image assignment if images exist
 
         if run_image_assignment and not is_accessory: # RTW Check
-            ghosts_editorials = [img for img in images_for_cpi if img.get('asset_type') in ['ghosts', 'editorials'] and img.get('filename')]
-            has_hero = any('hero_image' in img.get('filename','').lower() for img in ghosts_editorials)
-            has_model = any('model_image' in img.get('filename','').lower() for img in ghosts_editorials)
+            ghosts_editorials, ghosts_editorials_lower = [], []
+            for img, name in zip(images_for_cpi, filenames_lower):
+                if img.get('asset_type') in ['ghosts', 'editorials'] and img.get('filename'):
+                    ghosts_editorials.append(img)
+                    ghosts_editorials_lower.append(name)
+            has_hero = any('hero_image' in name for name in ghosts_editorials_lower)
+            has_model = any('model_image' in name for name in ghosts_editorials_lower)
             if not has_hero or not has_model:
                 reason = "Missing Hero or Model Images"
                 print(f"  > ANOMALY: {reason} for non-accessory CPI {cpi} (Handle: '{handle}')")
@@ -544,25 +641,11 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
                      print(f"  > INFO: Override insertion skipped for '{handle}'. Filtered files list was empty (contained only primary ghosts).")
 
             # 4. Assign Images and Create New Rows for separate CSV
-            existing_indices = list(product_group.index)
+            existing_indices = list(group_indices)
             num_images = len(final_image_list)
             num_rows = len(existing_indices)
             max_iterations = max(num_images, num_rows)
 
-            parent_row_template = None # Define outside loop
-            if num_images > num_rows: # Prepare template only if needed
-                 parent_row_template = export_df.loc[parent_row_index].to_dict()
-                 cols_to_preserve = ['Handle', 'Vendor', 'Product Category', 'Type', 'Variant Price']
-                 for col in parent_row_template:
-                     if col not in cols_to_preserve: parent_row_template[col] = ''
-                 parent_row_template['Title'] = ''
-                 parent_row_template['Body (HTML)'] = ''
-                 parent_row_template['Image Position'] = pd.NA
-                 parent_row_template['Variant Grams'] = pd.NA
-                 parent_row_template['Gift Card'] = False
-                 parent_row_template['Variant Requires Shipping'] = pd.NA
-                 parent_row_template['Variant Taxable'] = pd.NA
-
             # group_new_rows = [] # Not needed if not concatenating
 
             for i in range(max_iterations):
@@ -572,31 +655,47 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
                 if image_exists and row_exists:
                     index = existing_indices[i]
                     filename = final_image_list[i]['filename']
-                    export_df.loc[index, 'Image Src'] = CDN_PREFIX + filename.replace(' ', '_')
-                    export_df.loc[index, 'Image Position'] = i + 1 # Assign as int
+                    image_src_updates[index] = CDN_PREFIX + filename.replace(' ', '_')
+                    image_pos_updates[index] = i + 1 # Assign as int
                 elif image_exists and not row_exists:
-                    if parent_row_template is None:
-                         print(f"  > ERROR: Cannot create missing image row for handle '{handle}' - template missing.")
-                         continue
                     filename = final_image_list[i]['filename']
-                    new_row = parent_row_template.copy()
-                    new_row['Image Src'] = CDN_PREFIX + filename.replace(' ', '_')
-                    new_row['Image Position'] = float(i + 1) # Assign as float for now
-                    missing_image_rows.append(new_row) # Add to list for separate CSV
+                    # Only Handle, Image Src and Image Position reach the CSV; the
+                    # Handle is taken from the parent row when the frame is built
+                    missing_image_rows.append((parent_position, CDN_PREFIX + filename.replace(' ', '_'), float(i + 1)))
 
                 elif not image_exists and row_exists:
                     index = existing_indices[i]
-                    export_df.loc[index, 'Image Src'] = ''
-                    export_df.loc[index, 'Image Position'] = pd.NA
+                    image_src_updates[index] = ''
+                    image_pos_updates[index] = np.nan
         else: # If run_image_assignment was false
-             export_df.loc[product_group.index, 'Image Src'] = ''
-             export_df.loc[product_group.index, 'Image Position'] = pd.NA
+             image_src_updates.update(dict.fromkeys(group_indices, ''))
+             image_pos_updates.update(dict.fromkeys(group_indices, np.nan))
+
+    # --- Apply collected updates: one vectorized assignment per column ---
+    # Image Position goes in as float64 (NaN for cleared rows) to match the
+    # column read from the export; it is cast to Int64 before writing
+    for col, updates, dtype in (
+        ('Tags', tag_updates, object),
+        ('Body (HTML)', body_updates, object),
+        (DETAILS_COL, details_updates, object),
+        ('Image Src', image_src_updates, object),
+        ('Image Position', image_pos_updates, 'float64'),
+    ):
+        if updates:
+            updates_s = pd.Series(updates, dtype=dtype)
+            export_df.loc[updates_s.index, col] = updates_s.values
 
 
     # --- Save Missing Image Rows to Separate CSV ---
     if missing_image_rows:
         print(f"  > INFO: Found {len(missing_image_rows)} extra image rows to save separately.")
-        missing_rows_df = pd.DataFrame(missing_image_rows)
+        parent_positions, image_srcs, image_positions = zip(*missing_image_rows)
+        # Built column-wise in one go: Handle is gathered from the parent rows
+        missing_rows_df = pd.DataFrame({
+            'Handle': export_df['Handle'].to_numpy()[list(parent_positions)],
+            'Image Src': image_srcs,
+            'Image Position': image_positions,
+        })
 
         # Define filename with timestamp
         missing_filename = f"missing_img_src_files_{timestamp}.csv"
@@ -700,21 +799,26 @@ def main(capsule: str, dry_run: bool, override_file: str = None):
         # missing_filename is already defined with timestamp where it's saved
 
         full_output_path = output_dir / full_filename
-        full_enriched_df.to_csv(full_output_path, index=False)
-        print(f"\n✅ Full enriched CSV ({len(full_enriched_df)} rows) written successfully to: {full_output_path}")
-
         ready_output_path = output_dir / ready_filename
-        import_ready_df.to_csv(ready_output_path, index=False)
+        anomalies_output_path = output_dir / anomalies_filename
+        anomalies_report_output_path = output_dir / report_filename
+
+        # The output files are independent; write them concurrently
+        writes = [(full_enriched_df, full_output_path), (import_ready_df, ready_output_path)]
+        if not anomalies_df.empty:
+            writes.append((anomalies_df, anomalies_output_path))
+        if not anomalies_report_df.empty:
+            writes.append((anomalies_report_df, anomalies_report_output_path))
+        with ThreadPoolExecutor(max_workers=len(writes)) as pool:
+            list(pool.map(lambda job: job[0].to_csv(job[1], index=False), writes))
+
+        print(f"\n✅ Full enriched CSV ({len(full_enriched_df)} rows) written successfully to: {full_output_path}")
         print(f"✅ Import-ready CSV ({len(import_ready_df)} rows) written successfully to: {ready_output_path}")
 
         if not anomalies_df.empty:
-            anomalies_output_path = output_dir / anomalies_filename
-            anomalies_df.to_csv(anomalies_output_path, index=False)
             print(f"⚠️  {len(anomalies_df)} rows with anomalies staged for review in: {anomalies_output_path}")
 
         if not anomalies_report_df.empty:
-            anomalies_report_output_path = output_dir / report_filename
-            anomalies_report_df.to_csv(anomalies_report_output_path, index=False)
             print(f"📊 {anomalies_report_df['Handle'].nunique()} products with anomalies detailed in: {anomalies_report_output_path}")
         elif not anomalies_df.empty:
              print("ℹ️  Anomaly details logged but structured report generation failed or resulted empty.")
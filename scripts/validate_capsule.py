@@ -2,7 +2,14 @@ import pandas as pd
 import pathlib
 import argparse
 import re
-import json
+import sys
+
+# Project root on the path so the shared 'utils' package resolves when run as a script
+project_root = pathlib.Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.tracker_csv import find_header_row
+from utils.product_tags import extract_cpis_from_tags, split_category_tags
 
 CPI_PATTERN_FROM_PRODUCT_ID = re.compile(
     r"(?:[FS]\d{3}|[A-Z]{2}\d{2})[-_]?(\d{3,5}).*?(\d{6})"
@@ -31,6 +38,8 @@ CATEGORY_TAGS_MAP = {
     88: "collection_ready-to-wear, collection_knitwear, collection_tops"
 }
 
+CATEGORY_TAGS = split_category_tags(CATEGORY_TAGS_MAP)
+
 def extract_product_id_from_tags(tags_str: str) -> str | None:
     """Finds the tag that represents the full Product ID."""
     if not isinstance(tags_str, str): return None
@@ -69,8 +78,8 @@ def get_expected_tags(source_record):
     if pd.notna(source_record.get('Colour')):
         expected_tags.add(f"color_{' '.join(str(source_record['Colour']).split(' ')[1:]).lower()}")
     
-    if category_code_to_use and category_code_to_use in CATEGORY_TAGS_MAP:
-        expected_tags.update([t.strip() for t in CATEGORY_TAGS_MAP[category_code_to_use].split(',')])
+    if category_code_to_use and category_code_to_use in CATEGORY_TAGS:
+        expected_tags.update(CATEGORY_TAGS[category_code_to_use])
 
     return expected_tags
 
@@ -78,105 +87,123 @@ def check_image_validity(df: pd.DataFrame, manifest_df: pd.DataFrame, handle_to_
     """Validates Image Src URLs against the manifest and construction rules."""
     errors = []
     CDN_PREFIX = 'https://cdn.shopify.com/s/files/1/0148/9561/2004/files/'
-    
-    # Create a lookup for manifest files for faster access
-    manifest_lookup = manifest_df.groupby('cpi')['filename'].apply(list).to_dict()
-
-    for index, row in df.iterrows():
-        image_src = row['Image Src']
-        if pd.isna(image_src) or image_src.strip() == '':
-            continue # Skip blank image sources
 
-        handle = row['Handle']
-        
+    image_src = df['Image Src']
+    rows = df.loc[image_src.notna() & (image_src.str.strip() != ''), ['Handle', 'Image Src']] # Skip blank image sources
+    rows = rows.assign(
+        filename=rows['Image Src'].str.replace(CDN_PREFIX, '', regex=False),
+        cpi=rows['Handle'].map(handle_to_cpi_map),
+    )
+
+    # Manifest cross-reference as one left merge on (cpi, filename) instead of a
+    # per-row lookup; manifest filenames are compared with spaces as underscores
+    manifest_pairs = pd.DataFrame({
+        'cpi': manifest_df['cpi'],
+        'filename': manifest_df['filename'].str.replace(' ', '_', regex=False),
+    }).drop_duplicates()
+    checked = rows.merge(manifest_pairs, on=['cpi', 'filename'], how='left', indicator=True)
+
+    has_prefix = checked['Image Src'].str.startswith(CDN_PREFIX)
+    has_spaces = checked['filename'].str.contains(' ', regex=False)
+    in_manifest = checked['_merge'] == 'both'
+
+    # Only the error records themselves are built in Python, in row order
+    for handle, src, filename_from_url, cpi, prefix_ok, spaces, found in zip(
+        checked['Handle'], checked['Image Src'], checked['filename'], checked['cpi'],
+        has_prefix, has_spaces, in_manifest,
+    ):
         # 1. Prefix Check
-        if not image_src.startswith(CDN_PREFIX):
-            errors.append({'error_type': 'Invalid Image URL Prefix', 'handle': handle, 'details': f"URL '{image_src}' has an incorrect prefix."})
+        if not prefix_ok:
+            errors.append({'error_type': 'Invalid Image URL Prefix', 'handle': handle, 'details': f"URL '{src}' has an incorrect prefix."})
             continue
 
-        filename_from_url = image_src.replace(CDN_PREFIX, '')
-        
         # 2. Snake Case Check
-        if ' ' in filename_from_url:
+        if spaces:
             errors.append({'error_type': 'Image URL Contains Spaces', 'handle': handle, 'details': f"Filename '{filename_from_url}' in URL contains spaces instead of underscores."})
 
         # 3. Manifest Cross-Reference Check
-        cpi = handle_to_cpi_map.get(handle)
-        if not cpi:
+        if pd.isna(cpi):
             errors.append({'error_type': 'Cannot Validate Image (No CPI)', 'handle': handle, 'details': f"Could not map handle '{handle}' to a CPI to validate its images."})
             continue
-            
-        valid_filenames_for_cpi = manifest_lookup.get(cpi, [])
-        # Compare by replacing spaces with underscores in the manifest filenames
-        valid_shopify_filenames = [fn.replace(' ', '_') for fn in valid_filenames_for_cpi]
 
-        if filename_from_url not in valid_shopify_filenames:
+        if not found:
             errors.append({
                 'error_type': 'Image Not Found in Manifest', 'handle': handle, 'cpi': cpi,
                 'details': f"Filename '{filename_from_url}' for handle '{handle}' is not listed in the manifest for CPI '{cpi}'."
             })
-            
+
     return errors
 
 def check_data_consistency_against_sources(df: pd.DataFrame, tracker_df: pd.DataFrame) -> list:
     """Validates enriched data against the master tracker file."""
     errors = []
-    tracker_df_indexed = tracker_df.set_index('Product ID')
-
-    for handle, group in df.groupby('Handle'):
-        # Find the parent row, which is the only one with a non-blank Title
-        parent_rows = group[group['Title'].notna() & (group['Title'] != '')]
-        if parent_rows.empty:
-            # This case is handled by check_internal_structure, so we can skip here
-            continue
-        parent_row = parent_rows.iloc[0]
-        full_product_id = extract_product_id_from_tags(parent_row['Tags'])
-
-        if not full_product_id or full_product_id not in tracker_df_indexed.index:
+    tracker_df_indexed = tracker_df.drop_duplicates('Product ID').set_index('Product ID')
+    details_col = 'Details (product.metafields.altuzarra.details)'
+
+    # Parent row per handle: the first row with a non-blank Title, in sorted-handle order.
+    # Handles without one are handled by check_internal_structure, so they are skipped here.
+    parents = df[df['Handle'].notna() & df['Title'].notna() & (df['Title'] != '')]
+    parents = parents.drop_duplicates('Handle').sort_values('Handle', kind='stable')
+
+    # Join every parent to its tracker record with one reindex instead of a .loc per handle
+    product_ids = parents['Tags'].map(extract_product_id_from_tags)
+    found = product_ids.notna() & product_ids.isin(tracker_df_indexed.index)
+    source_records = dict(zip(
+        parents['Handle'][found], tracker_df_indexed.reindex(product_ids[found]).to_dict('records')
+    ))
+
+    # Expected price per handle; None when the tracker value is not a number
+    expected_prices = {}
+    for handle, source_record in source_records.items():
+        try: expected_prices[handle] = float(source_record['RRP (USD)'])
+        except (ValueError, TypeError): expected_prices[handle] = None
+
+    # Compare every *actual* variant row (non-empty SKU) to its tracker price at once
+    variant_rows = df[df['Variant SKU'].notna() & (df['Variant SKU'] != '')]
+    variant_prices_numeric = pd.to_numeric(variant_rows['Variant Price'], errors='coerce')
+    expected_numeric = pd.to_numeric(variant_rows['Handle'].map(expected_prices), errors='coerce')
+    price_mismatch_handles = set(variant_rows['Handle'][~variant_prices_numeric.eq(expected_numeric)])
+    non_numeric_price_handles = set(variant_rows['Handle'][variant_prices_numeric.isna()])
+
+    actual_details_col = parents[details_col] if details_col in parents.columns else pd.Series('', index=parents.index)
+
+    # Only the per-handle error records are built in Python
+    for handle, tags, actual_details, full_product_id, is_found in zip(
+        parents['Handle'], parents['Tags'], actual_details_col, product_ids, found
+    ):
+        if not is_found:
             errors.append({
                 'error_type': 'Source Record Not Found', 'handle': handle,
-                'details': f"Could not find Product ID '{full_product_id}' (from tags) in the tracker CSV."
+                'details': f"Could not find Product ID '{full_product_id if pd.notna(full_product_id) else None}' (from tags) in the tracker CSV."
             })
             continue
-        
-        source_record = tracker_df_indexed.loc[full_product_id]
+
+        source_record = source_records[handle]
 
         # Validate Variant Price
-        try:
-            # 1. Get the tracker price as a float
-            expected_price = float(source_record['RRP (USD)'])
-            
-            # 2. Filter for *actual* variant rows (non-empty SKU)
-            variant_rows = group[group['Variant SKU'].notna() & (group['Variant SKU'] != '')]
-            
-            # 3. NEW: Convert the 'Variant Price' column from str to float for comparison
-            variant_prices_numeric = pd.to_numeric(variant_rows['Variant Price'], errors='coerce')
-
-            # 4. Now, compare the numeric Series to the float
-            if not variant_prices_numeric.eq(expected_price).all():
-                # Add a check to see if conversion failed
-                if variant_prices_numeric.isna().any():
-                     errors.append({
-                        'error_type': 'Invalid Price in Ready File', 'handle': handle,
-                        'details': f"One or more variants have a non-numeric price (e.g., blank) in the 'ready' file."
-                    })
-                else:
-                    errors.append({
-                        'error_type': 'Price Mismatch', 'handle': handle,
-                        'details': f"One or more variants do not match tracker RRP (USD) of ${expected_price}."
-                    })
-        except (ValueError, TypeError):
-             errors.append({
+        expected_price = expected_prices[handle]
+        if expected_price is None:
+            errors.append({
                 'error_type': 'Invalid Price in Source', 'handle': handle,
                 'details': f"RRP (USD) value '{source_record['RRP (USD)']}' for Product ID '{full_product_id}' is not a valid number."
             })
-            
+        elif handle in price_mismatch_handles:
+            # Add a check to see if conversion failed
+            if handle in non_numeric_price_handles:
+                errors.append({
+                    'error_type': 'Invalid Price in Ready File', 'handle': handle,
+                    'details': f"One or more variants have a non-numeric price (e.g., blank) in the 'ready' file."
+                })
+            else:
+                errors.append({
+                    'error_type': 'Price Mismatch', 'handle': handle,
+                    'details': f"One or more variants do not match tracker RRP (USD) of ${expected_price}."
+                })
+
         # Validate Details Metafield
         # NEW: Get and strip both values before comparing to avoid whitespace errors
         expected_details = str(source_record['PRODUCT DETAILS']).strip()
-        actual_details = str(parent_row.get('Details (product.metafields.altuzarra.details)', '')).strip()
-
-        if expected_details != actual_details:
+        if expected_details != str(actual_details).strip():
              errors.append({
                 'error_type': 'Details Metafield Mismatch', 'handle': handle,
                 'details': f"Details metafield does not match tracker 'PRODUCT DETAILS' column."
@@ -184,7 +211,7 @@ def check_data_consistency_against_sources(df: pd.DataFrame, tracker_df: pd.Data
 
         # Validate Tags
         expected_tags = get_expected_tags(source_record)
-        actual_tags = set([t.strip() for t in parent_row.get('Tags', '').split(',')])
+        actual_tags = set([t.strip() for t in tags.split(',')])
         missing_tags = expected_tags - actual_tags
         if missing_tags:
             errors.append({
@@ -260,24 +287,24 @@ def main(capsule: str):
         df_ready = pd.read_csv(ready_file_path, dtype=str)     
            
         tracker_df_raw = pd.read_csv(tracker_file_path, header=None, encoding='cp1252', keep_default_na=False)
-        header_row_index = tracker_df_raw[tracker_df_raw.apply(lambda r: r.astype(str).str.contains('Product ID').any(), axis=1)].index[0]
+        header_row_index = find_header_row(tracker_df_raw)
         df_tracker = tracker_df_raw.copy()
         df_tracker.columns = df_tracker.iloc[header_row_index]
         df_tracker = df_tracker.drop(df_tracker.index[:header_row_index + 1]).reset_index(drop=True)
         df_tracker.columns = df_tracker.columns.str.strip()
         
-        manifest_recs = [json.loads(line) for line in manifest_path.read_text().splitlines() if line.strip()]
-        df_manifest = pd.DataFrame(manifest_recs)
+        # pandas' C JSON parser reads the JSONL straight into columns (blank lines are skipped);
+        # values are kept as parsed, without dtype or date inference
+        df_manifest = pd.read_json(manifest_path, lines=True, dtype=False, convert_dates=False)
 
     except FileNotFoundError as e:
         print(f"❌ File not found: {e}. Please ensure capsule inputs and outputs exist.")
         return
 
     # Build the Handle-to-CPI map needed for image validation
-    handle_to_cpi_map = {
-        row['Handle']: cpi for _, row in df_ready[df_ready['Title'].notna()].iterrows()
-        if (cpi := extract_cpi_from_product_id(extract_product_id_from_tags(row['Tags'])))
-    }
+    parent_rows = df_ready[df_ready['Title'].notna()]
+    parent_cpis = extract_cpis_from_tags(parent_rows['Tags'], CPI_PATTERN_FROM_PRODUCT_ID)
+    handle_to_cpi_map = dict(zip(parent_rows['Handle'][parent_cpis.notna()], parent_cpis.dropna()))
 
     all_errors = [] # Initialize the master error list
 
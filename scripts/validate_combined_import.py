@@ -2,9 +2,16 @@ import pandas as pd
 import pathlib
 import argparse
 import re
-import json
 from collections import Counter
 import math # For checking NaN
+import sys
+
+# Project root on the path so the shared 'utils' package resolves when run as a script
+project_root = pathlib.Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.tracker_csv import find_header_row
+from utils.product_tags import extract_product_ids_from_tags, extract_cpis_from_tags, split_category_tags
 
 # --- Logic copied/adapted from enrich_shopify_import.py ---
 
@@ -56,7 +63,10 @@ CATEGORY_TAGS_MAP = {
     84: "collection_ready-to-wear, collection_knitwear, collection_tops, collection_new-arrivals", 85: "collection_ready-to-wear, collection_knitwear, collection_skirts, collection_new-arrivals",
     86: "collection_ready-to-wear, collection_knitwear, collection_pants, collection_new-arrivals", 88: "collection_ready-to-wear, collection_knitwear, collection_tops, collection_new-arrivals"
 }
+CATEGORY_TAGS = split_category_tags(CATEGORY_TAGS_MAP)
 CPI_PATTERN_FROM_PRODUCT_ID = re.compile(r"(\d{3,5})\s+[A-Z0-9]+\s+(\d{6})")
+# The Product ID is the first tag with at least two spaces, as in extract_product_id_from_tags
+PRODUCT_ID_TAG_PATTERN = re.compile(r" .* ", re.DOTALL)
 
 def extract_product_id_from_tags(tags_str: str) -> str | None:
     if not isinstance(tags_str, str): return None
@@ -89,8 +99,8 @@ def get_expected_tags(source_record):
     if pd.notna(source_record.get('Description')): expected_tags.add(f"style_{source_record['Description'].title()}")
     if pd.notna(source_record.get('SEASON CODE')): expected_tags.add(str(source_record['SEASON CODE']).replace('S1', 'SS'))
     if pd.notna(source_record.get('Colour')): expected_tags.add(f"color_{' '.join(str(source_record['Colour']).split(' ')[1:]).lower()}")
-    if category_code_to_use and category_code_to_use in CATEGORY_TAGS_MAP:
-        expected_tags.update([t.strip() for t in CATEGORY_TAGS_MAP[category_code_to_use].split(',')])
+    if category_code_to_use and category_code_to_use in CATEGORY_TAGS:
+        expected_tags.update(CATEGORY_TAGS[category_code_to_use])
     return expected_tags
 
 # --- Image Sorting Logic ---
@@ -387,8 +397,10 @@ def check_data_consistency_against_sources(df: pd.DataFrame, tracker_df: pd.Data
         # Pre-process tracker for faster lookups
         tracker_df['Product ID'] = tracker_df['Product ID'].astype(str).str.strip()
         tracker_df_indexed = tracker_df.set_index('Product ID')
-        # Pre-calculate expected tags for all source records
-        expected_tags_map = {idx: get_expected_tags(row) for idx, row in tracker_df_indexed.iterrows()}
+        # Expected tags are computed lazily, once per Product ID actually referenced,
+        # rather than for every tracker row up front (last row wins on duplicate IDs)
+        tags_source = tracker_df_indexed[~tracker_df_indexed.index.duplicated(keep='last')]
+        expected_tags_map = {}
     except KeyError:
          errors.append({'error_type': 'Setup Failed', 'details': "Could not find 'Product ID' column in tracker."})
          return errors
@@ -397,6 +409,10 @@ def check_data_consistency_against_sources(df: pd.DataFrame, tracker_df: pd.Data
          return errors
 
 
+    # Product IDs for every parent row in one vectorized pass, looked up by row label below
+    parent_mask = df['Title'].notna() & (df['Title'] != '')
+    product_id_by_row = extract_product_ids_from_tags(df.loc[parent_mask, 'Tags'], PRODUCT_ID_TAG_PATTERN).dropna().to_dict()
+
     for handle, group in df.groupby('Handle'):
         parent_rows = group[group['Title'].notna() & (group['Title'] != '')]
         if parent_rows.empty: continue # Handled by internal structure check
@@ -404,7 +420,7 @@ def check_data_consistency_against_sources(df: pd.DataFrame, tracker_df: pd.Data
 
         # Extract Product ID carefully, handle potential NaN/None
         tags_str = parent_row.get('Tags')
-        full_product_id = extract_product_id_from_tags(tags_str) if pd.notna(tags_str) else None
+        full_product_id = product_id_by_row.get(parent_row.name)
 
         if not full_product_id:
             if group['Image Src'].notna().any():
@@ -476,7 +492,9 @@ def check_data_consistency_against_sources(df: pd.DataFrame, tracker_df: pd.Data
         # --- END .strip() ADDITION ---
 
         # --- Validate Tags (only on parent row) ---
-        expected_tags = expected_tags_map.get(full_product_id, set())
+        expected_tags = expected_tags_map.get(full_product_id)
+        if expected_tags is None:
+            expected_tags = expected_tags_map[full_product_id] = get_expected_tags(tags_source.loc[full_product_id])
         actual_tags_list = [t.strip() for t in str(tags_str).split(',') if t.strip()] if pd.notna(tags_str) else []
         actual_tags_set = set(actual_tags_list)
 
@@ -509,7 +527,7 @@ def main(capsule: str, input_filename: str, override_filename: str):
 
         print(f"Loading tracker: {tracker_file_path}...")
         tracker_df_raw = pd.read_csv(tracker_file_path, header=None, encoding='cp1252', keep_default_na=False)
-        header_row_index = tracker_df_raw[tracker_df_raw.apply(lambda r: r.astype(str).str.contains('Product ID').any(), axis=1)].index[0]
+        header_row_index = find_header_row(tracker_df_raw)
         df_tracker = tracker_df_raw.copy()
         df_tracker.columns = df_tracker.iloc[header_row_index]
         df_tracker = df_tracker.drop(df_tracker.index[:header_row_index + 1]).reset_index(drop=True)
@@ -517,10 +535,15 @@ def main(capsule: str, input_filename: str, override_filename: str):
         print(f"  > Loaded tracker data.")
 
         print(f"Loading manifest: {manifest_path}...")
-        manifest_recs = [json.loads(line) for line in manifest_path.read_text().splitlines() if line.strip()]
-        df_manifest = pd.DataFrame(manifest_recs)
-        # Create CPI -> [images] map
-        manifest_map = df_manifest.groupby('cpi').apply(lambda x: x.to_dict('records')).to_dict()
+        # pandas' C JSON parser reads the JSONL straight into columns (blank lines are skipped);
+        # values are kept as parsed, without dtype or date inference
+        df_manifest = pd.read_json(manifest_path, lines=True, dtype=False, convert_dates=False)
+        # Create CPI -> [images] map in one pass over the records, instead of a
+        # per-group apply + to_dict for every CPI (rows without a CPI are dropped, as groupby did)
+        manifest_map = {}
+        for rec in df_manifest.to_dict('records'):
+            if pd.notna(rec.get('cpi')):
+                manifest_map.setdefault(rec['cpi'], []).append(rec)
         print(f"  > Loaded manifest data for {len(manifest_map)} CPIs.")
 
     except FileNotFoundError as e:
@@ -545,11 +568,9 @@ def main(capsule: str, input_filename: str, override_filename: str):
 
 
     # Build Handle-to-CPI map from the *target* dataframe (parent rows only)
-    handle_to_cpi_map = {}
-    for _, row in df_target[df_target['Title'].notna() & (df_target['Title'] != '')].iterrows():
-        cpi = extract_cpi_from_product_id(extract_product_id_from_tags(row['Tags']))
-        if cpi:
-            handle_to_cpi_map[row['Handle']] = cpi
+    parent_rows = df_target[df_target['Title'].notna() & (df_target['Title'] != '')]
+    parent_cpis = extract_cpis_from_tags(parent_rows['Tags'], CPI_PATTERN_FROM_PRODUCT_ID, PRODUCT_ID_TAG_PATTERN)
+    handle_to_cpi_map = dict(zip(parent_rows['Handle'][parent_cpis.notna()], parent_cpis.dropna()))
 
     print(f"Built Handle-to-CPI map for {len(handle_to_cpi_map)} products from target file.")
 
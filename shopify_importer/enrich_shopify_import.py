@@ -1,6 +1,8 @@
 import pandas as pd
 import re
 
+MODEL_IMAGE_PATTERN = re.compile(r'model_image_(\d+)')
+
 def find_image_filename(product_id, file_contents):
     """
     Generic function to search raw text content of a file to find a filename.
@@ -21,7 +23,7 @@ def find_and_sort_model_images(product_id, model_file_contents):
     def sort_key(filename):
         if 'hero_image' in filename:
             return 0
-        match = re.search(r'model_image_(\d+)', filename)
+        match = MODEL_IMAGE_PATTERN.search(filename)
         if match:
             return int(match.group(1))
         return 999
@@ -175,18 +177,16 @@ def enrich_shopify_import_poc(source_file, scaffold_file, ghost_file, model_file
     product_group_df.loc[parent_row_index, 'Variant Price'] = source_record['RRP (USD)']
     
     # --- Enrich Child Rows ---
-    for i, (index, row) in enumerate(child_rows.iterrows()):
-        if i < len(model_image_files):
-            model_filename = model_image_files[i]
-            shopify_model_filename = model_filename.replace(' ', '_')
-            full_image_url = cdn_prefix + shopify_model_filename
-            product_group_df.loc[index, 'Image Src'] = full_image_url
-            product_group_df.loc[index, 'Image Position'] = i + 2
-        else:
-            product_group_df.loc[index, 'Image Src'] = ''
-            product_group_df.loc[index, 'Image Position'] = ''
-            
-        product_group_df.loc[index, 'Variant Price'] = source_record['RRP (USD)']
+    # Build the column values first, then write each column once for all child rows
+    child_index = child_rows.index
+    num_with_image = min(len(model_image_files), len(child_index))
+    num_blank = len(child_index) - num_with_image
+    image_srcs = [cdn_prefix + fn.replace(' ', '_') for fn in model_image_files[:num_with_image]] + [''] * num_blank
+    image_positions = list(range(2, num_with_image + 2)) + [''] * num_blank
+
+    product_group_df.loc[child_index, 'Image Src'] = image_srcs
+    product_group_df.loc[child_index, 'Image Position'] = image_positions
+    product_group_df.loc[child_index, 'Variant Price'] = source_record['RRP (USD)']
 
     # --- Phase 3: Final Data Cleaning and Save ---
     
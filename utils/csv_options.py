@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+csv_options.py
+
+pandas read_csv settings shared by the CSV readers. pyarrow is probed
+without being imported, so importing this module stays cheap.
+"""
+
+import importlib.util
+
+_HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# pyarrow's multithreaded CSV parser when installed
+CSV_ENGINE = "pyarrow" if _HAS_PYARROW else "c"
+# Arrow-backed strings when pyarrow is installed: compact UTF-8 buffers, faster .str ops
+STRING_DTYPE = "string[pyarrow]" if _HAS_PYARROW else "string"
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+product_tags.py
+
+Tag helpers shared by the enrichment and validation scripts: vectorized
+Product ID / CPI lookups over a Shopify export's Tags column (each script
+passes its own patterns) and the category-code tag map pre-split.
+"""
+
+import re
+
+import pandas as pd
+
+
+def extract_product_ids_from_tags(tags: pd.Series, product_id_pattern: re.Pattern) -> pd.Series:
+    """Returns, per row, the first comma-separated tag matching product_id_pattern.
+    Index-aligned with tags (NaN where none is found)."""
+    exploded = tags.dropna().astype(str).str.split(',').explode().str.strip()
+    # count() > 0 is a regex search that, unlike str.contains, does not warn on capture groups
+    product_ids = exploded[exploded.str.count(product_id_pattern) > 0]
+    return product_ids[~product_ids.index.duplicated(keep='first')].reindex(tags.index)
+
+
+def extract_cpis_from_tags(tags: pd.Series, cpi_pattern: re.Pattern,
+                           product_id_pattern: re.Pattern | None = None) -> pd.Series:
+    """Returns, per row, the '<style>-<color>' CPI built from the two groups of
+    cpi_pattern in the row's Product ID tag. The Product ID is found with
+    product_id_pattern, defaulting to cpi_pattern itself.
+    Index-aligned with tags (NaN where none is found)."""
+    product_ids = extract_product_ids_from_tags(tags, product_id_pattern or cpi_pattern).dropna()
+    parts = product_ids.str.extract(cpi_pattern).dropna()
+    return (parts[0] + '-' + parts[1]).reindex(tags.index)
+
+
+def split_category_tags(category_tags_map: dict) -> dict:
+    """Pre-splits a {category code: "tag, tag, ..."} map into stripped tag
+    tuples once, so per-record tag building does no string splitting."""
+    return {code: tuple(t.strip() for t in tags.split(',')) for code, tags in category_tags_map.items()}
@@ -15,10 +15,21 @@ Schema version: STATE_SCHEMA v1.0
 """
 
 from __future__ import annotations
+import functools
 import json
 import pathlib
 from dataclasses import dataclass
-from typing import Optional, Dict
+from typing import Any, Optional, Dict, List
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 # --- Public API -------------------------------------------------------------
@@ -38,6 +49,61 @@ class GateDecision:
     state_snapshot: Dict[str, Optional[str]]
 
 
+# --- Typed bulk decode (optional) -------------------------------------------
+
+if msgspec is not None:
+    class ProductState(msgspec.Struct):
+        """Typed view of the product_state fields the writers filter on."""
+        allowed_actions: Optional[Dict[str, Any]] = None
+        tags: List[str] = []
+        cpi: Optional[str] = None
+
+    class _StateFile(msgspec.Struct):
+        products: Dict[str, ProductState] = {}
+
+    _STATE_DECODER = msgspec.json.Decoder(_StateFile)
+
+
+@functools.lru_cache(maxsize=32)
+def _decode_products_cached(path_str: str, mtime: float):
+    try:
+        return _STATE_DECODER.decode(pathlib.Path(path_str).read_bytes()).products
+    except msgspec.DecodeError:
+        # Malformed JSON or a schema mismatch (ValidationError is a DecodeError)
+        return None
+
+
+def load_typed_products(state_file: str | pathlib.Path) -> Optional[Dict[str, "ProductState"]]:
+    """
+    Decode and type-check every product in one pass with msgspec.
+
+    Returns None when msgspec is not installed, the file is not valid JSON or
+    it does not match the schema; callers then fall back to their own loading
+    and per-entry checks.
+    """
+    if msgspec is None:
+        return None
+    path = pathlib.Path(state_file)
+    return _decode_products_cached(str(path.resolve()), path.stat().st_mtime)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_state_json_cached(path_str: str, mtime: float) -> dict:
+    raw = pathlib.Path(path_str).read_bytes()
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+
+def load_state_json(state_file: str | pathlib.Path) -> dict:
+    """
+    Parsed product_state JSON, memoized per (path, mtime) so repeat loads in
+    one process skip the re-parse until the file changes.
+
+    Callers must not mutate the result.
+    """
+    path = pathlib.Path(state_file)
+    return _load_state_json_cached(str(path.resolve()), path.stat().st_mtime)
+
+
 class StateGate:
     """
     Read-only evaluator for product action permissions.
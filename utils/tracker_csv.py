@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+tracker_csv.py
+
+Helpers for the merchandising tracker CSV, whose real header row sits
+below a block of free-form title rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def find_header_row(df_raw: pd.DataFrame) -> int:
+    """Returns the index of the first row with a cell containing 'Product ID'.
+    df_raw is the tracker read with header=None."""
+    # One vectorized substring search over the sheet instead of a per-row apply
+    header_row_mask = (np.char.find(df_raw.to_numpy(dtype=str), 'Product ID') >= 0).any(axis=1)
+    return df_raw.index[header_row_mask][0]